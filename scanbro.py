@@ -26,12 +26,33 @@
 # at some of the recipes here: https://jon.dehdari.org/tutorials/pdf_tricks.html
 
 import argparse
+import array
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import errno
+import fcntl
+import functools
+import hashlib
+import json
+import mmap
 import os
 import pathlib
+import random
+import re
+import resource
 import shutil
+import socket
+import socketserver
+import sqlite3
+import struct
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+import zlib
 
 class Color:
     PURPLE = '\033[95m'
@@ -46,22 +67,35 @@ class Color:
     UNDERLINE = '\033[4m'
     END = '\033[0m'
 
+    # If set, the Progress whose status line is kept below the output.
+    status = None
+
+    @staticmethod
+    def write(line):
+        if Color.status is None:
+            print(line)
+            return
+        with Color.status.lock:
+            Color.status.clear()
+            print(line, flush=True)
+            Color.status.redraw()
+
     @staticmethod
     def debug(msg, dim=False):
-        if dim: print(f"{Color.GRAY} > {msg}{Color.END}")
-        else: print(f"{Color.RED}->{Color.GRAY} {msg}{Color.END}")
+        if dim: Color.write(f"{Color.GRAY} > {msg}{Color.END}")
+        else: Color.write(f"{Color.RED}->{Color.GRAY} {msg}{Color.END}")
 
     @staticmethod
     def print(msg, prefix="--"):
-        print(f"{prefix}{msg}")
+        Color.write(f"{prefix}{msg}")
 
     @staticmethod
     def info(msg, prefix="::"):
-        print(f"{Color.BOLD}{prefix} {msg}{Color.END}")
+        Color.write(f"{Color.BOLD}{prefix} {msg}{Color.END}")
 
     @staticmethod
     def error(msg, prefix="##"):
-        print(f"{Color.RED}{prefix}{Color.END} {msg}")
+        Color.write(f"{Color.RED}{prefix}{Color.END} {msg}")
 
     @staticmethod
     def input(msg, prefix="<-", suffix=": "):
@@ -187,43 +221,1139 @@ def with_filepath(filename, name):
     return with_suffix(name, p.suffix[1:])
 
 
+def clone_file(src, dst):
+    """Create dst as a copy-on-write clone of src, if the filesystem supports it."""
+    FICLONE = 0x40049409
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+def rename_file(src, dst):
+    """
+    Move src to dst by renaming it, or by cloning it if src and dst are on
+    different filesystems that support this. Only if neither is possible is
+    the file copied.
+    """
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    if clone_file(src, dst):
+        os.remove(src)
+    else:
+        shutil.move(src, dst)
+
+
+def unshare_file(path):
+    """
+    Give path an inode of its own if it is hardlinked, such as to an entry
+    of the StageCache, so that changing it does not change the other.
+    """
+    if os.stat(path).st_nlink <= 1:
+        return
+    temp = path + '.tmp'
+    if not clone_file(path, temp):
+        shutil.copyfile(path, temp)
+    os.replace(temp, path)
+
+
+def parse_size(size: str) -> int:
+    """Parse a size in bytes with an optional K, M, or G suffix."""
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    size = size.strip().upper().rstrip('B')
+    if size[-1:] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def format_size(size: int) -> str:
+    for unit in ['B', 'K', 'M', 'G']:
+        if size < 1024 or unit == 'G':
+            break
+        size /= 1024
+    return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+
+
+def cache_home():
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+        'scanbro',
+    )
+
+
+def data_home():
+    return os.path.join(
+        os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')),
+        'scanbro',
+    )
+
+
+class CancelScope:
+    """
+    The commands started by a group of workers in other threads, so that
+    the first failure of a worker kills the commands of all others. Scopes
+    of workers that start workers of their own are cancelled with them.
+    """
+
+    local = threading.local()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.procs = set()
+        self.children = []
+        self.cancelled = False
+        parent = CancelScope.current()
+        if parent is not None:
+            with parent.lock:
+                parent.children.append(self)
+                self.cancelled = parent.cancelled
+
+    @staticmethod
+    def current():
+        return getattr(CancelScope.local, 'scope', None)
+
+    def run(self, function, *args):
+        """Call function in the current thread as a worker of the scope."""
+        outer = CancelScope.current()
+        CancelScope.local.scope = self
+        try:
+            return function(*args)
+        finally:
+            CancelScope.local.scope = outer
+
+    def started(self, proc):
+        """Add proc to the scope, or kill it if the scope was cancelled."""
+        with self.lock:
+            if not self.cancelled:
+                self.procs.add(proc)
+                return
+        proc.kill()
+
+    def finished(self, proc):
+        with self.lock:
+            self.procs.discard(proc)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            procs = list(self.procs)
+            children = list(self.children)
+        # The workers reap their own children.
+        for proc in procs:
+            proc.kill()
+        for child in children:
+            child.cancel()
+
+
+def run_parallel(function, items, jobs=1):
+    """
+    Apply function to every item with at most jobs workers, returning the
+    results in the same order as items.
+
+    The first exception raised by a worker cancels all items that have not
+    been started yet, and kills the commands of the items already running.
+    These are waited for, and then the exception is re-raised.
+    """
+    if jobs <= 1 or len(items) <= 1:
+        return [function(x) for x in items]
+    scope = CancelScope()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(scope.run, function, x) for x in items]
+        done, pending = concurrent.futures.wait(
+            futures, return_when=concurrent.futures.FIRST_EXCEPTION
+        )
+        for f in pending:
+            f.cancel()
+        if len(pending) > 0:
+            scope.cancel()
+        # Raise the exception that caused the others.
+        for f in futures:
+            if f in done and f.exception() is not None:
+                raise f.exception()
+        return [f.result() for f in futures]
+
+
+async def run_tasks(function, items, jobs=1):
+    """
+    Await function(item) for every item with at most jobs running at the same
+    time, returning the results in the same order as items.
+
+    The first exception cancels all other items, which kills the commands
+    they are running, and is then re-raised.
+    """
+    semaphore = asyncio.Semaphore(max(jobs, 1))
+    async def limited(x):
+        async with semaphore:
+            return await function(x)
+    tasks = [asyncio.ensure_future(limited(x)) for x in items]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for t in tasks:
+            if t.done() and not t.cancelled() and t.exception() is not None:
+                raise t.exception()
+        return [t.result() for t in tasks]
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class StageCache:
+    """
+    Store the output of stages keyed by the contents of their input files
+    and the arguments of the command, so that unchanged work is not
+    repeated when scanbro is run again.
+
+    Entries are evicted in least-recently-used order when the cache
+    grows larger than max_size bytes.
+    """
+
+    def __init__(self, directory=None, max_size=2 << 30):
+        if directory is None:
+            directory = os.path.join(cache_home(), 'stages')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # Entries are readable like any other file created by the user.
+        umask = os.umask(0)
+        os.umask(umask)
+        self.mode = 0o666 & ~umask
+        # The total size is only known exactly after every eviction, since
+        # other processes may share the cache.
+        self.size = None
+
+    @staticmethod
+    def placeholders(cmd, input_files, output_file):
+        """Return cmd with the filenames replaced by placeholders."""
+        # Some programs only take the output file without suffix, so we
+        # replace that as well.
+        names = [(output_file, '{out}'), (os.path.splitext(output_file)[0], '{out}')]
+        names.extend((file, '{in}') for file in input_files)
+        # A name can be part of a longer one, which is replaced first.
+        names.sort(key=lambda n: len(n[0]), reverse=True)
+        args = []
+        for arg in cmd:
+            for name, placeholder in names:
+                arg = arg.replace(name, placeholder)
+            args.append(arg)
+        return args
+
+    @staticmethod
+    def key(cmd, input_files, output_file):
+        h = hashlib.sha256()
+        for file in input_files:
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            h.update(b'\0')
+
+        # Filenames should not affect the key, only the contents and the
+        # remaining arguments.
+        for arg in StageCache.placeholders(cmd, input_files, output_file):
+            h.update(arg.encode() + b'\0')
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def lookup(self, key, output_file):
+        """Provide output_file from the cache and return whether it was found."""
+        path = self.path(key)
+        with self.lock:
+            if not os.path.exists(path):
+                return False
+            os.utime(path)
+        Color.debug(f'ln {path} {output_file}')
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        try:
+            os.link(path, output_file)
+        except OSError:
+            if not clone_file(path, output_file):
+                shutil.copyfile(path, output_file)
+        return True
+
+    def store(self, key, output_file):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        shutil.copyfile(output_file, tmp)
+        os.chmod(tmp, self.mode)
+        os.replace(tmp, path)
+        with self.lock:
+            if self.size is not None:
+                self.size += os.path.getsize(path)
+            evict = self.size is None or self.size > self.max_size
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for sub in os.scandir(self.directory):
+                if sub.is_dir():
+                    entries.extend(e for e in os.scandir(sub.path) if e.is_file())
+            entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in entries]
+            total = sum(e[1] for e in entries)
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                os.remove(path)
+                total -= size
+            self.size = total
+
+
+class HashCache:
+    """
+    Store perceptual hashes of files keyed by their path, size and time of
+    modification, so that a file is only hashed again if it changed.
+
+    Entries that have not been used for max_age seconds are removed.
+    """
+
+    max_age = 30 * 24 * 3600
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(cache_home(), 'hashes.sqlite')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS hashes '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)'
+            )
+            self.db.execute('DELETE FROM hashes WHERE used < ?', (time.time() - self.max_age,))
+
+    def get(self, file, kind, function):
+        """Return the hash of file, calling function(file) if it is not cached."""
+        stat = os.stat(file)
+        key = f'{kind}:{os.path.realpath(file)}:{stat.st_size}:{stat.st_mtime_ns}'
+        with self.lock, self.db:
+            row = self.db.execute('SELECT value FROM hashes WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self.db.execute('UPDATE hashes SET used = ? WHERE key = ?', (time.time(), key))
+                return int(row[0], 16)
+        value = function(file)
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO hashes (key, value, used) VALUES (?, ?, ?)',
+                (key, format(value, 'x'), time.time()),
+            )
+        return value
+
+
+class Usage:
+    """Resources used by a single command, with times in seconds."""
+
+    def __init__(self, wall=0.0, user=0.0, system=0.0, maxrss=0):
+        self.wall = wall
+        self.user = user
+        self.system = system
+        self.maxrss = maxrss
+
+    def __repr__(self):
+        return "Usage({:.3f}, {:.3f}, {:.3f}, {})".format(self.wall, self.user, self.system, self.maxrss)
+
+    def cpu(self):
+        return self.user + self.system
+
+
+class Tracer:
+    """
+    Record the resource usage of every command that is run in a JSON Lines
+    file, and summarize it per stage.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w')
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def close(self):
+        self.file.close()
+
+    def record(self, stage, cmd, usage, input_files, output_files, cached=False):
+        def size(files):
+            return sum(os.path.getsize(f) for f in files if os.path.exists(f))
+        entry = {
+            'time': time.time(),
+            'stage': stage,
+            'cmd': cmd,
+            'cached': cached,
+            'wall': usage.wall,
+            'user': usage.user,
+            'system': usage.system,
+            'maxrss': usage.maxrss,
+            'input_bytes': size(input_files),
+            'output_bytes': size(output_files),
+        }
+        with self.lock:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            total = self.stages.setdefault(stage, {
+                'calls': 0, 'cached': 0, 'wall': 0.0, 'cpu': 0.0, 'maxrss': 0,
+                'input_bytes': 0, 'output_bytes': 0,
+            })
+            total['calls'] += 1
+            total['cached'] += int(cached)
+            total['wall'] += usage.wall
+            total['cpu'] += usage.cpu()
+            total['maxrss'] = max(total['maxrss'], usage.maxrss)
+            total['input_bytes'] += entry['input_bytes']
+            total['output_bytes'] += entry['output_bytes']
+
+    def summary(self):
+        Color.info(f'Trace written to {self.path}')
+        Color.print(
+            f"{'stage':<10} {'calls':>6} {'cached':>6} {'wall [s]':>9} {'cpu [s]':>9} {'max rss':>9} {'input':>9} {'output':>9}",
+            prefix='   ',
+        )
+        for stage, t in self.stages.items():
+            Color.print(
+                f"{stage:<10} {t['calls']:>6} {t['cached']:>6} {t['wall']:>9.2f} {t['cpu']:>9.2f} "
+                f"{format_size(t['maxrss']):>9} {format_size(t['input_bytes']):>9} {format_size(t['output_bytes']):>9}",
+                prefix='   ',
+            )
+
+
+class Progress:
+    """
+    Count the pages that every stage has completed, and report the current
+    rate of each, the queue of pages waiting in front of each, and the
+    estimated time to completion. On a terminal this is a status line below
+    the output, otherwise a JSON Lines event every interval seconds.
+
+    The stage with the longest queue in front of it is the bottleneck.
+
+    Several documents can share a Progress, such as when reading files,
+    and each adds its stages and pages to it. If document is given, it
+    names what is reported, since several runs can report at the same
+    time, and only the first of them gets the status line.
+    """
+
+    window = 60
+
+    # Guards Color.status while runs take and release it.
+    claim = threading.Lock()
+
+    def __init__(self, stages, stream=None, interval=None, document=None):
+        self.stream = stream if stream is not None else sys.stderr
+        self.tty = self.stream.isatty()
+        self.interval = interval if interval is not None else (1 if self.tty else 5)
+        self.document = document
+        self.stages = []
+        self.done = {}
+        self.recent = {}
+        self.totals = {}
+        self.expected = False
+        self.include(stages)
+        self.start = time.monotonic()
+        self.line = ''
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.owner = False
+
+    def __enter__(self):
+        self.take_status()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.report()
+        if not self.tty:
+            return
+        with Progress.claim, self.lock:
+            if self.owner:
+                self.clear()
+                Color.status = None
+                self.stream.write(self.line + '\n')
+                self.stream.flush()
+        if not self.owner:
+            # Another run has the status line, so the summary goes above it.
+            Color.write(self.line)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def take_status(self):
+        """Show the status line on the terminal, unless another run does."""
+        if not self.tty or self.owner:
+            return
+        with Progress.claim:
+            if Color.status is None:
+                Color.status = self
+                self.owner = True
+
+    def include(self, stages):
+        """
+        Add stages that are not known yet, each in front of the next one
+        of stages that is known, or at the end.
+        """
+        for i, s in enumerate(stages):
+            if s in self.done:
+                continue
+            following = [t for t in stages[i + 1:] if t in self.done]
+            index = self.stages.index(following[0]) if following else len(self.stages)
+            self.stages.insert(index, s)
+            self.done[s] = 0
+            self.recent[s] = collections.deque()
+            self.totals[s] = 0
+
+    def expect(self, pages, stages=None):
+        """Add pages that stages, or all of them, have to complete."""
+        with self.lock:
+            stages = self.stages if stages is None else stages
+            self.include(stages)
+            for s in stages:
+                self.totals[s] += pages
+            self.expected = True
+
+    def advance(self, stage, pages=1):
+        now = time.monotonic()
+        with self.lock:
+            self.done[stage] += pages
+            self.recent[stage].append((now, pages))
+
+    def drop(self, stage, pages=1):
+        """Count pages that stage dropped as done for the stages after it."""
+        with self.lock:
+            for s in self.stages[self.stages.index(stage) + 1:]:
+                self.done[s] += pages
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            stages = []
+            previous = None
+            remaining = 0.0
+            for s in self.stages:
+                while len(self.recent[s]) > 0 and self.recent[s][0][0] < now - self.window:
+                    self.recent[s].popleft()
+                span = min(self.window, now - self.start)
+                rate = sum(p for _, p in self.recent[s]) / span * 60 if span > 0 else 0.0
+                done = self.done[s]
+                total = self.totals[s] if self.expected else self.done[self.stages[0]]
+                # Pages of documents that skip the previous stage or this
+                # one go straight to the next one.
+                queue = 0
+                if previous is not None:
+                    queue = max(0, previous[0] + total - previous[1] - done)
+                stages.append({
+                    'stage': s,
+                    'done': done,
+                    'pages_per_min': rate,
+                    'queue': queue,
+                })
+                previous = (done, total)
+                if done >= total:
+                    continue
+                if rate > 0 and remaining is not None:
+                    remaining = max(remaining, (total - done) / rate * 60)
+                else:
+                    remaining = None
+            queues = [s['queue'] for s in stages]
+            bottleneck = stages[queues.index(max(queues))]['stage'] if max(queues) > 0 else None
+            event = {
+                'time': time.time(),
+                'elapsed': now - self.start,
+                'total': max(self.totals.values()) if self.expected else None,
+                'stages': stages,
+                'eta': remaining,
+                'bottleneck': bottleneck,
+            }
+            if self.document is not None:
+                event['document'] = self.document
+            return event
+
+    def format(self, event):
+        parts = []
+        for s in event['stages']:
+            part = f"{s['stage']} {s['done']}"
+            if s['queue'] > 0:
+                part = f"[{s['queue']}] " + part
+            part += f" {s['pages_per_min']:.0f}/min"
+            if s['stage'] == event['bottleneck']:
+                part += '*'
+            parts.append(part)
+        eta = event['eta']
+        left = '?:??' if eta is None else f'{int(eta) // 60}:{int(eta) % 60:02d}'
+        line = f"{' > '.join(parts)} | {left} left"
+        if self.document is not None:
+            line = f'{os.path.basename(self.document)}: {line}'
+        return line
+
+    def report(self):
+        event = self.snapshot()
+        if not self.stopped.is_set():
+            self.take_status()
+        with self.lock:
+            if self.tty:
+                if self.owner:
+                    self.clear()
+                self.line = self.format(event)
+                if self.owner:
+                    self.redraw()
+            else:
+                self.stream.write(json.dumps(event) + '\n')
+                self.stream.flush()
+
+    def clear(self):
+        self.stream.write('\r\033[K')
+
+    def redraw(self):
+        self.stream.write(self.line)
+        self.stream.flush()
+
+
+class Workdir:
+    """
+    Keep intermediate files in a fast working directory, such as a tmpfs
+    under /dev/shm, as long as the files in it take up less than budget
+    bytes. Beyond that, intermediate files spill to the destination.
+
+    The directory is only created when the first file is placed in it.
+    Every file that is placed reserves an estimate of its size until the
+    stage that creates it has finished, so that concurrent jobs cannot
+    overshoot the budget together.
+    """
+
+    def __init__(self, parent, budget):
+        self.parent = parent
+        self.budget = budget
+        self.path = None
+        self.lock = threading.Lock()
+        self.reserved = {}
+
+    def usage(self):
+        """Return the bytes used or reserved, which requires holding the lock."""
+        sizes = {}
+        if self.path is not None:
+            for e in os.scandir(self.path):
+                try:
+                    if e.is_file():
+                        sizes[e.path] = e.stat().st_size
+                except FileNotFoundError:
+                    # Removed by a job that is running at the same time.
+                    pass
+        reserved = sum(max(size, sizes.pop(file, 0)) for file, size in self.reserved.items())
+        return reserved + sum(sizes.values())
+
+    def place(self, file, destination, estimate=0):
+        """
+        Return where the intermediate file should be created, which is
+        expected to take up estimate bytes.
+        """
+        name = os.path.basename(file)
+        with self.lock:
+            if self.usage() + estimate < self.budget:
+                if self.path is None:
+                    self.path = tempfile.mkdtemp(prefix='scanbro-', dir=self.parent)
+                path = os.path.join(self.path, name)
+                self.reserved[path] = estimate
+                return path
+        return os.path.join(destination, name)
+
+    def release(self):
+        """Count the files placed so far by their size, once they are complete."""
+        with self.lock:
+            self.reserved.clear()
+
+    def move(self, destination):
+        """Move the files that are left to destination."""
+        if self.path is None:
+            return
+        for e in sorted(os.scandir(self.path), key=lambda e: e.name):
+            file = os.path.join(destination, e.name)
+            Color.debug(f'mv {e.path} {file}')
+            rename_file(e.path, file)
+
+    def cleanup(self):
+        if self.path is None:
+            return
+        Color.debug(f'rm -r {self.path}')
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Manifest:
+    """
+    Record which output every stage of the pipeline created from which
+    input files, so that a run that failed can be resumed without redoing
+    the work that was already completed.
+
+    The manifest is a JSON Lines log that every step is appended to. It is
+    flushed after every step, which survives scanbro crashing, but only
+    synced to disk every sync_interval seconds and when it is finished.
+    A recorded output can be reused if it still exists, or if it was
+    cleaned up after a later stage used it to create an output that can
+    be reused in turn.
+
+    The log starts with the command of every stage, and a run can only be
+    resumed with the same commands, so that all pages are processed alike.
+    """
+
+    sync_interval = 5
+
+    def __init__(self, path, pipeline, resume=False):
+        self.path = path
+        self.pipeline = pipeline
+        self.lock = threading.Lock()
+        self.stages = [{} for p in pipeline]
+        self.consumers = {}
+        self.producers = {}
+        self.final = None
+        self.sources = None
+        entries = [{
+            'pipeline': [p.binary for p in pipeline],
+            'commands': [p.signature() for p in pipeline],
+        }]
+        if resume and os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # The last step was only partially written.
+                        break
+            header = entries[1] if len(entries) > 1 else {}
+            if header.get('pipeline') != entries[0]['pipeline']:
+                raise Exception(f'cannot resume from {path} with a different pipeline')
+            commands = header.get('commands') or [None] * len(pipeline)
+            for p, command, signature in zip(pipeline, commands, entries[0]['commands']):
+                if command != signature:
+                    raise Exception(f'cannot resume from {path} with different arguments for {p.binary}, run without --resume to start over')
+            entries = entries[1:]
+            for entry in entries[1:]:
+                if 'stage' in entry:
+                    self.add(pipeline[entry['stage']], entry['inputs'], entry['output'])
+                else:
+                    self.final, self.sources = entry['final'], entry['sources']
+            Color.info(f'Resume from {path}')
+        # Start a new log, without any partially written step.
+        temp = path + '.tmp'
+        with open(temp, 'w') as file:
+            file.writelines(json.dumps(e) + '\n' for e in entries)
+        os.replace(temp, path)
+        self.file = open(path, 'a')
+        self.synced = time.monotonic()
+
+    def add(self, p, input_files, output_file):
+        index = self.pipeline.index(p)
+        self.stages[index][json.dumps(input_files)] = output_file
+        for file in input_files:
+            self.consumers.setdefault(file, []).append((index, output_file))
+        # Stages that select pages keep the file they were given.
+        if output_file is not None and output_file not in input_files:
+            self.producers[output_file] = (index, input_files)
+
+    def producer(self, file):
+        """
+        Return the index of the stage that created file and its input
+        files, or None if file was not created by the pipeline.
+        """
+        return self.producers.get(file)
+
+    def source(self, file):
+        """Return the name that the final output file was created with."""
+        return self.sources[self.final.index(file)]
+
+    def usable(self, file, index):
+        # Sidecars, such as the text that tesseract recognized, are only
+        # read after the run, so later outputs cannot stand in for them.
+        if not all(os.path.exists(f) for f in self.pipeline[index].sidecars(file)):
+            return False
+        if os.path.exists(file):
+            return True
+        return any(
+            output is not None and i > index and self.usable(output, i)
+            for i, output in self.consumers.get(file, [])
+        )
+
+    def lookup(self, p, input_files):
+        """
+        Return whether p already processed input_files, and the output file.
+        The output file is None if p dropped the page.
+        """
+        index = self.pipeline.index(p)
+        with self.lock:
+            key = json.dumps(input_files)
+            if key not in self.stages[index]:
+                return False, None
+            output_file = self.stages[index][key]
+            if output_file is not None and not self.usable(output_file, index):
+                return False, None
+            return True, output_file
+
+    def record(self, p, input_files, output_file):
+        with self.lock:
+            self.add(p, input_files, output_file)
+            self.write({'stage': self.pipeline.index(p), 'inputs': input_files, 'output': output_file})
+
+    def write(self, entry, sync=False):
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        if sync or time.monotonic() - self.synced >= self.sync_interval:
+            os.fsync(self.file.fileno())
+            self.synced = time.monotonic()
+
+    def complete(self):
+        if self.final is None or not all(os.path.exists(f) for f in self.final):
+            return False
+        return all(
+            os.path.exists(f)
+            for file, (index, _) in self.producers.items()
+            for f in self.pipeline[index].sidecars(file)
+        )
+
+    def finish(self, final_output, sources):
+        with self.lock:
+            self.final = final_output
+            self.sources = sources
+            self.write({'final': final_output, 'sources': sources}, sync=True)
+
+    def close(self):
+        self.file.close()
+
+    def remove(self):
+        self.close()
+        Color.debug(f'rm {self.path}')
+        os.remove(self.path)
+
+
+class SearchIndex:
+    """
+    Full-text index of the pages of scanned documents in SQLite FTS5.
+
+    Every document has a row in documents, and the rowid of each of its
+    pages is the document id shifted left by page_bits plus the page
+    number. Updating a document therefore only replaces its own range of
+    rows, and the index never has to be rebuilt.
+    """
+
+    page_bits = 20
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(data_home(), 'index.sqlite')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS documents '
+            '(id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, page_count INTEGER NOT NULL, indexed REAL NOT NULL)'
+        )
+        self.db.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS pages '
+            "USING fts5(text, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.db.close()
+
+    def update(self, path, pages):
+        """Replace the text of the document at path with pages."""
+        path = os.path.abspath(path)
+        if len(pages) >= 1 << self.page_bits:
+            raise Exception(f'cannot index more than {(1 << self.page_bits) - 1} pages of {path}')
+        with self.db:
+            row = self.db.execute('SELECT id FROM documents WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                id = self.db.execute(
+                    'INSERT INTO documents (path, page_count, indexed) VALUES (?, ?, ?)',
+                    (path, len(pages), time.time()),
+                ).lastrowid
+            else:
+                id = row[0]
+                self.db.execute(
+                    'DELETE FROM pages WHERE rowid BETWEEN ? AND ?',
+                    (id << self.page_bits, ((id + 1) << self.page_bits) - 1),
+                )
+                self.db.execute(
+                    'UPDATE documents SET page_count = ?, indexed = ? WHERE id = ?',
+                    (len(pages), time.time(), id),
+                )
+            self.db.executemany(
+                'INSERT INTO pages (rowid, text) VALUES (?, ?)',
+                [((id << self.page_bits) + page, text) for page, text in enumerate(pages, 1)],
+            )
+
+    def search(self, query, limit=20):
+        """
+        Return the path, page number and a snippet of the best matches of
+        query, which uses the FTS5 query syntax. If it is not valid syntax,
+        its words are searched for literally.
+        """
+        sql = (
+            "SELECT d.path, p.rowid & ?, snippet(pages, 0, ?, ?, '...', 12) "
+            'FROM pages p JOIN documents d ON d.id = p.rowid >> ? '
+            'WHERE pages MATCH ? ORDER BY rank LIMIT ?'
+        )
+        mask = (1 << self.page_bits) - 1
+        highlight = (Color.BOLD, Color.END)
+        try:
+            return self.db.execute(sql, (mask, *highlight, self.page_bits, query, limit)).fetchall()
+        except sqlite3.OperationalError:
+            literal = ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+            return self.db.execute(sql, (mask, *highlight, self.page_bits, literal, limit)).fetchall()
+
+
+@functools.lru_cache(maxsize=None)
+def which(binary):
+    """Return the path of binary, looking it up only once per process."""
+    return shutil.which(binary)
+
+
 class Processor:
     binary = "false"
     multiple_in = 1
     multiple_out = False
+    cache = None
+
+    # Processors that can use several threads name the environment
+    # variable that limits them; threads is set by the Scheduler.
+    max_threads = 1
+    thread_env = None
+    threads = None
+
+    # If set, every command that is run is recorded by the Tracer.
+    tracer = None
+
+    # If set, a semaphore that every command and in-process step holds while
+    # it runs, so that concurrent jobs share a fixed number of slots.
+    slots = None
+
+    # If set, commands that run longer than this many seconds are killed.
+    timeout = None
+
+    # If set, the pages that every stage completes are counted by Progress.
+    progress = None
+
+    # Processors that can read from stdin or write to stdout name the
+    # argument that is given instead of the input or output file.
+    pipe_in = None
+    pipe_out = None
+
+    # Processors that select pages instead of transforming them implement
+    # keep(file, dryrun) instead of command.
+    selects = False
+
+    # Processors whose partitions are separate documents, as with group-by.
+    # Unless the number of jobs is given, these use all cores.
+    documents = False
+
+    # Selecting processors that compare every page with the pages before it
+    # are ordered. Their keep is called one page at a time in page order,
+    # after prepare(file, dryrun) has been called for the pages in parallel.
+    ordered = False
+
+    # The file types that the processor can read, where None means any.
+    accepts = None
+
+    def reads(self, filetype):
+        return self.accepts is None or filetype in self.accepts
+
+    def is_conversion(self):
+        """Return whether the processor only changes the file type."""
+        return False
 
     def __init__(self):
-        if shutil.which(self.binary) is None:
+        if which(self.binary) is None:
             raise Exception(f"cannot find executable {self.binary}")
 
     @staticmethod
-    def run_cmd(cmd, stdin=None, stdout=None):
-        result = subprocess.run(
-            cmd,
-            stdin=stdin,
-            stdout=stdout,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
+    def wait_cmd(proc, start):
+        """Wait for proc, which was started at time start, and return its Usage."""
+        # Wait for the child ourselves, so that we get its own resource
+        # usage, which is correct even if other children are running.
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return Usage(
+            time.monotonic() - start,
+            rusage.ru_utime,
+            rusage.ru_stime,
+            rusage.ru_maxrss * 1024,
         )
-        if result.returncode != 0:
-            Color.error("Error:")
-            print(result.stderr)
-            raise ChildProcessError()
+
+    @staticmethod
+    async def exited(proc):
+        """Wait until proc has exited without reaping it, so that wait_cmd can."""
+        loop = asyncio.get_running_loop()
+        try:
+            fd = os.pidfd_open(proc.pid)
+        except (AttributeError, OSError):
+            # Without pidfd, poll for the exit instead.
+            while os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+                await asyncio.sleep(0.05)
+            return
+        done = loop.create_future()
+        loop.add_reader(fd, lambda: done.done() or done.set_result(None))
+        try:
+            await done
+        finally:
+            loop.remove_reader(fd)
+            os.close(fd)
+
+    @staticmethod
+    @contextlib.asynccontextmanager
+    async def hold_slot():
+        """Hold one of the slots, without blocking the event loop while waiting."""
+        slots = Processor.slots
+        if slots is None:
+            yield
+            return
+        acquired = asyncio.get_running_loop().run_in_executor(None, slots.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # The thread still takes the slot, so give it back once it has.
+            acquired.add_done_callback(lambda f: slots.release())
+            raise
+        try:
+            yield
+        finally:
+            slots.release()
+
+    @staticmethod
+    async def run_cmd_async(cmd, stdin=None, stdout=None, env=None, timeout=None):
+        """
+        Run cmd to completion without blocking the event loop, and return its
+        Usage. The command is killed if it runs longer than timeout seconds,
+        or if the task running it is cancelled.
+        """
+        async with Processor.hold_slot():
+            start = time.monotonic()
+            with tempfile.TemporaryFile(mode='w+') as stderr:
+                proc = subprocess.Popen(
+                    cmd,
+                    stdin=stdin,
+                    stdout=stdout,
+                    stderr=stderr,
+                    env=env,
+                    universal_newlines=True
+                )
+                scope = CancelScope.current()
+                if scope is not None:
+                    scope.started(proc)
+                try:
+                    await asyncio.wait_for(Processor.exited(proc), timeout)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    Processor.wait_cmd(proc, start)
+                    raise Exception(f'{cmd[0]} was killed after running for {timeout} seconds')
+                except asyncio.CancelledError:
+                    proc.kill()
+                    Processor.wait_cmd(proc, start)
+                    raise
+                finally:
+                    if scope is not None:
+                        scope.finished(proc)
+                usage = Processor.wait_cmd(proc, start)
+                if scope is not None and scope.cancelled:
+                    raise Exception(f'{cmd[0]} was killed because another job failed')
+                if proc.returncode != 0:
+                    stderr.seek(0)
+                    Color.error("Error:")
+                    print(stderr.read())
+                    raise ChildProcessError()
+            return usage
+
+    @staticmethod
+    def run_cmd(cmd, stdin=None, stdout=None, env=None, timeout=None):
+        """Run cmd to completion and return its Usage."""
+        return asyncio.run(Processor.run_cmd_async(cmd, stdin, stdout, env, timeout))
 
     def suffix(self, file):
         return with_suffix(file, self.binary + '.' + self.filetype)
 
+    def sidecars(self, output_file):
+        """Return the files that the command writes besides output_file."""
+        return []
+
+    def environment(self):
+        if self.thread_env is None or self.threads is None:
+            return None
+        env = dict(os.environ)
+        env[self.thread_env] = str(self.threads)
+        return env
+
     def command(self, input_files, output_file):
         assert(type(input_files) is list and len(input_files) > 0)
         assert(self.multiple_in == 1)
         return [self.binary, input_files[0], output_file]
 
+    def signature(self):
+        """
+        Return the command with placeholders instead of filenames, which
+        only differs between two processors if they create different output.
+        """
+        input_files, output_file = ['/scanbro-input'], f'/scanbro-output.{self.filetype}'
+        return StageCache.placeholders(self.command(input_files, output_file), input_files, output_file)
+
     def process(self, input_files, output_file, dryrun=False, stdin=None, stdout=None):
         assert(type(input_files) is list and len(input_files) > 0)
         cmd = self.command(input_files, output_file)
+        # Sidecar files are cached under the key of the output file and
+        # their position, and only a complete set counts as a hit.
+        output_files = [output_file] + self.sidecars(output_file)
+        keys = None
+        if self.cache is not None and not dryrun and stdin is None and stdout is None:
+            key = self.cache.key(cmd, input_files, output_file)
+            keys = [key] + [f'{key}.{i}' for i in range(1, len(output_files))]
+            if all(self.cache.lookup(k, f) for k, f in zip(keys, output_files)):
+                self.trace(cmd, Usage(), input_files, output_files, cached=True)
+                return
         Color.debug(" ".join(cmd), dryrun)
         if not dryrun:
-            self.run_cmd(cmd, stdin, stdout)
+            usage = self.execute(cmd, input_files, output_file, stdin, stdout)
+            self.trace(cmd, usage, input_files, output_files)
+            if keys is not None:
+                for k, f in zip(keys, output_files):
+                    self.cache.store(k, f)
+
+    def execute(self, cmd, input_files, output_file, stdin=None, stdout=None):
+        """
+        Run cmd and return its Usage. Processors that work in-process
+        override this instead of process, to keep caching and tracing.
+        """
+        return self.run_cmd(cmd, stdin, stdout, self.environment(), self.timeout)
+
+    @staticmethod
+    def run_func(function, *args):
+        """Call function in the current thread and return its Usage."""
+        with Processor.slots or contextlib.nullcontext():
+            start = time.monotonic()
+            before = resource.getrusage(resource.RUSAGE_THREAD)
+            function(*args)
+            after = resource.getrusage(resource.RUSAGE_THREAD)
+        return Usage(
+            time.monotonic() - start,
+            after.ru_utime - before.ru_utime,
+            after.ru_stime - before.ru_stime,
+        )
+
+    def trace(self, cmd, usage, input_files, output_files, cached=False):
+        if self.tracer is not None:
+            self.tracer.record(self.binary, cmd, usage, input_files, output_files, cached)
 
 
 class Option:
@@ -260,6 +1390,7 @@ class Scanner(Processor):
 
     binary = 'scanimage'
     filetype = 'tiff'
+    formats = ['tiff', 'pnm', 'png', 'jpeg']
     multiple_out = True
 
     def __init__(self, config):
@@ -336,29 +1467,74 @@ class Scanner(Processor):
             Color.debug(' '.join(cmd) + f' > {output_file}', dryrun)
             if not dryrun:
                 with open(output_file, 'w') as file:
-                    self.run_cmd(cmd, stdout=file)
+                    usage = self.run_cmd(cmd, stdout=file)
+                self.trace(cmd, usage, [], [output_file])
         else:
             cmd = self.command(input_device, output_file)
             Color.debug(" ".join(cmd), dryrun)
             if not dryrun:
-                self.run_cmd(cmd, stdin, stdout)
+                usage = self.run_cmd(cmd, stdin, stdout)
+                self.trace(cmd, usage, [], self.output(output_file))
+
+    def stream(self, prototype, dryrun=False):
+        """
+        Scan from the ADF and yield every file as soon as scanimage reports
+        that it has been completely written.
+
+        If the generator is closed before scanimage is done, the scan is
+        aborted.
+        """
+        assert(self.is_adf())
+        self.assert_output_format(prototype)
+        cmd = self.command(None, prototype)
+        cmd.append('--batch-print')
+        Color.debug(' '.join(cmd), dryrun)
+        if dryrun:
+            return
+        files = []
+        with Processor.slots or contextlib.nullcontext():
+            with tempfile.TemporaryFile(mode='w+') as stderr:
+                start = time.monotonic()
+                proc = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=stderr,
+                    universal_newlines=True,
+                )
+                try:
+                    for line in proc.stdout:
+                        file = line.strip()
+                        if file != '':
+                            files.append(file)
+                            yield file
+                    usage = self.wait_cmd(proc, start)
+                    self.trace(cmd, usage, [], files)
+                finally:
+                    if proc.poll() is None:
+                        proc.terminate()
+                        proc.wait()
+                if proc.returncode != 0:
+                    stderr.seek(0)
+                    Color.error("Error:")
+                    print(stderr.read())
+                    raise ChildProcessError()
 
     def scan(self, output_file, clobber=False, exclude=[], interactive=False, dryrun=False):
         delete_excludes = True
         def scan_once(output_file):
-            if scanner.is_adf():
+            if self.is_adf():
                 output_file = with_presuffix(output_file, '%d')
             # Scan image if file doesn't exist:
-            if not scanner.exists(output_file) or clobber:
-                Color.info(f"Scan from {scanner.name}")
-                scanner.process(None, output_file)
+            if not self.exists(output_file) or clobber:
+                Color.info(f"Scan from {self.name}")
+                self.process(None, output_file)
             else:
                 # Only delete excluded files if we actually scanned!
                 delete_excludes = False
-            return scanner.output(output_file)
+            return self.output(output_file)
 
         # Get a handle on the output filenames:
-        output_file = with_suffix(output_file, scanner.filetype)
+        output_file = with_suffix(output_file, self.filetype)
         scanned_files = []
         if interactive:
             iteration = 0
@@ -375,13 +1551,13 @@ class Scanner(Processor):
                     if answer == "":
                         Color.error("Invalid choice, try again.")
                     elif "source".startswith(answer):
-                        scanner.config["source"] = Color.input(
-                            f"Select one of {scanner.sources.choices.keys()}", prefix="<<",
+                        self.config["source"] = Color.input(
+                            f"Select one of {self.sources.choices.keys()}", prefix="<<",
                         )
                         continue
                     elif "papersize".startswith(answer):
-                        scanner.config["papersize"] = Color.input(
-                            f"Select one of {scanner.papersizes.choices.keys()}", prefix="<<",
+                        self.config["papersize"] = Color.input(
+                            f"Select one of {self.papersizes.choices.keys()}", prefix="<<",
                         )
                         continue
                     elif "continue".startswith(answer):
@@ -470,36 +1646,671 @@ class Brother_MFC_J5730DW(Scanner):
     duplex_sources = ['duplex', 'adf-left-duplex', 'adf-center-duplex']
 
 
-class Unpaper(Processor):
-    """Remove artifacts typically generated by scanning."""
+class SimulatedScanner(Scanner):
+    """
+    Generate synthetic pages within scanbro instead of scanning them, so
+    that the pipeline can be tested and benchmarked without a scanner.
 
-    binary = 'unpaper'
+    The device is a comma-separated list of settings, such as
+    pages=20,latency=0.5,blank=0.1,duplicate=0.05::
+
+        pages      number of pages in the ADF (default=5)
+        latency    seconds it takes to scan a page (default=0)
+        blank      fraction of pages that are blank (default=0)
+        duplicate  fraction of pages that repeat the previous page (default=0)
+        seed       seed for the random page content (default=0)
+
+    The files are named like the ones that scanimage --batch creates.
+    """
+
+    name = 'simulated scanner'
+    binary = 'simulated'
+    device = ''
     filetype = 'pnm'
+    formats = ['pnm', 'png']
+    defaults = {
+        'pages': 5,
+        'latency': 0.0,
+        'blank': 0.0,
+        'duplicate': 0.0,
+        'seed': 0,
+    }
+    papersizes = Option('a4', PAPERSIZES)
+    modes = Option('color', {
+        'bw':      [b'P4'],
+        'diffuse': [b'P4'],
+        'gray':    [b'P5'],
+        'color':   [b'P6'],
+    })
+    resolutions = Option('200', {r: [] for r in ['75', '100', '150', '200', '300', '400', '600']})
+    sources = Option('auto', {s: [] for s in ['auto', 'flatbed', 'adf', 'duplex']})
+    duplex_sources = ['duplex']
 
-    def command(self, input_files, output_file):
-        assert(type(input_files) is list and len(input_files) == 1)
-        input_file = input_files[0]
+    def __init__(self, config):
+        # There is no executable to check for.
+        self.config = config
+
+    def settings(self):
+        settings = dict(self.defaults)
+        for entry in self.device.split(','):
+            if entry == '':
+                continue
+            key, _, value = entry.partition('=')
+            if key not in settings:
+                raise Exception(f'unknown setting {key} of simulated scanner, require one of {list(settings)}')
+            settings[key] = type(settings[key])(value)
+        return settings
+
+    def command(self, input_device, output_file):
+        self.assert_output_format(output_file)
+        if input_device is None:
+            input_device = self.device
         cmd = [
             self.binary,
-            input_file,
-            output_file,
-            '--no-blackfilter',
+            '--device-name', input_device,
+            '--format', self.filetype,
         ]
+        if self.is_adf():
+            cmd.append(f'--batch={output_file}')
+        for key in ['papersize', 'mode', 'resolution', 'source']:
+            if self.config.get(key) is not None:
+                cmd.append(f'--{key}={self.config[key]}')
         return cmd
 
-class Tesseract(Processor):
-    """Create a searchable PDF by using the Tesseract OCR system."""
-
-    binary = 'tesseract'
+    def process(self, input_device, output_file, dryrun=False, stdin=None, stdout=None):
+        cmd = self.command(input_device, output_file)
+        Color.debug(' '.join(cmd), dryrun)
+        if not dryrun:
+            files = []
+            usage = self.run_func(lambda: files.extend(self.pages(output_file)))
+            self.trace(cmd, usage, [], files)
+
+    def stream(self, prototype, dryrun=False):
+        assert(self.is_adf())
+        cmd = self.command(None, prototype)
+        Color.debug(' '.join(cmd), dryrun)
+        if dryrun:
+            return
+        start = time.monotonic()
+        files = []
+        for file in self.pages(prototype):
+            files.append(file)
+            yield file
+        self.trace(cmd, Usage(time.monotonic() - start), [], files)
+
+    def pages(self, output_file):
+        """Generate the pages, and yield every file as soon as it is complete."""
+        settings = self.settings()
+        rng = random.Random(settings['seed'])
+        count = settings['pages'] if self.is_adf() else 1
+        previous = None
+        for index in range(1, count + 1):
+            file = output_file % index if self.is_adf() else output_file
+            time.sleep(settings['latency'])
+            if previous is not None and rng.random() < settings['duplicate']:
+                shutil.copyfile(previous, file)
+            else:
+                self.render(file, rng, rng.random() < settings['blank'])
+            previous = file
+            yield file
+
+    def render(self, path, rng, blank=False):
+        """Render a page with lines of random words, or a blank page with some specks."""
+        papersize = self.papersizes.args(self.config.get('papersize'))
+        # Raises an exception if the resolution is not supported.
+        self.resolutions.args(self.config.get('resolution'))
+        dpi = int(self.config.get('resolution') or self.resolutions.default)
+        magic = self.modes.args(self.config.get('mode'))[0]
+        width = round(papersize.w * dpi / 25.4)
+        height = round(papersize.h * dpi / 25.4)
+        pnm = path if self.filetype == 'pnm' else with_suffix(path, 'pnm')
+        with PNMImage.create(pnm, magic, width, height) as image:
+            white = self.encode(magic, b'\xff' * width)
+            for y in range(height):
+                image.set_row(y, white)
+            if blank:
+                for _ in range(rng.randint(0, 20)):
+                    row = bytearray(b'\xff' * width)
+                    x = rng.randrange(width - 2)
+                    row[x:x + 2] = b'\x00\x00'
+                    image.set_row(rng.randrange(height), self.encode(magic, bytes(row)))
+            else:
+                margin = dpi // 2
+                line = max(dpi // 6, 5)
+                y = margin
+                while y + line < height - margin:
+                    row = bytearray(b'\xff' * width)
+                    # Some lines end a paragraph early.
+                    end = width - margin
+                    if rng.random() < 0.2:
+                        end = rng.randrange(margin, end)
+                    x = margin
+                    while True:
+                        word = rng.randint(dpi // 12 + 1, dpi // 3 + 1)
+                        if x + word > end:
+                            break
+                        row[x:x + word] = b'\x20' * word
+                        x += word + dpi // 20 + 1
+                    text = self.encode(magic, bytes(row))
+                    for i in range(line * 3 // 5):
+                        image.set_row(y + i, text)
+                    y += line
+            if pnm != path:
+                image.save_png(path)
+        if pnm != path:
+            os.remove(pnm)
+
+    @staticmethod
+    def encode(magic, gray):
+        """Encode a row of 8-bit gray samples as a row of a PNM image of type magic."""
+        if magic == b'P5':
+            return gray
+        if magic == b'P6':
+            return bytes(v for v in gray for _ in range(3))
+        bits = gray.translate(bytes(ord('1') if v < 128 else ord('0') for v in range(256))).decode()
+        bits += '0' * (-len(bits) % 8)
+        return int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+class FileSource:
+    """
+    Read the pages of a document from existing image files instead of
+    scanning them, so that archives can be run through the same pipeline.
+
+    The files are never modified or deleted by the source.
+    """
+
+    binary = 'files'
+    name = 'files'
+    tracer = None
+    progress = None
+    filetypes = {
+        'tif':  'tiff',
+        'tiff': 'tiff',
+        'pnm':  'pnm',
+        'pbm':  'pnm',
+        'pgm':  'pnm',
+        'ppm':  'pnm',
+        'png':  'png',
+        'jpg':  'jpeg',
+        'jpeg': 'jpeg',
+    }
+
+    def __init__(self, files):
+        types = set(self.filetype_of(f) for f in files)
+        if None in types:
+            raise Exception(f'unsupported image type in {files}')
+        if len(types) != 1:
+            raise Exception(f'expected one image type per document, found {", ".join(sorted(types))}')
+        self.files = files
+        self.filetype = types.pop()
+        self.formats = [self.filetype]
+
+    @classmethod
+    def filetype_of(cls, file):
+        return cls.filetypes.get(pathlib.PurePath(file).suffix[1:].lower())
+
+    def is_adf(self):
+        return True
+
+    def is_duplex(self):
+        return False
+
+    def scan(self, output_file, clobber=False, exclude=[], interactive=False, dryrun=False):
+        return list(self.files)
+
+
+class Unpaper(Processor):
+    """Remove artifacts typically generated by scanning."""
+
+    binary = 'unpaper'
+    filetype = 'pnm'
+    accepts = ['pnm']
+    pipe_in = '-'
+    pipe_out = '-'
+
+    def command(self, input_files, output_file):
+        assert(type(input_files) is list and len(input_files) == 1)
+        input_file = input_files[0]
+        cmd = [
+            self.binary,
+            input_file,
+            output_file,
+            '--no-blackfilter',
+        ]
+        return cmd
+
+def read_pnm_header(data):
+    """
+    Parse the header of a binary PNM image at the start of data, and return
+    the magic number, width, height, maximum value, and offset of the pixels.
+    """
+    magic = bytes(data[:2])
+    if magic not in (b'P4', b'P5', b'P6'):
+        raise Exception(f'unsupported PNM format {magic}')
+    count = 2 if magic == b'P4' else 3
+    fields = []
+    i = 2
+    while len(fields) < count:
+        c = data[i:i+1]
+        if c == b'#':
+            i = data.find(b'\n', i)
+        elif c.isspace():
+            i += 1
+        else:
+            j = i
+            while data[j:j+1].isdigit():
+                j += 1
+            if i == j:
+                raise Exception('invalid PNM header')
+            fields.append(int(data[i:j]))
+            i = j
+    maxval = fields[2] if count == 3 else 1
+    # Exactly one whitespace character separates the header from the pixels.
+    return magic, fields[0], fields[1], maxval, i + 1
+
+
+class PNMImage:
+    """
+    Binary PBM, PGM, or PPM image that is accessed through a memory map of
+    its file, so that pixels are never decoded as a whole.
+
+    Rows are stored one after the other, each stride bytes long. Samples
+    are one byte, or two bytes in big-endian order if maxval > 255.
+    Bitmaps store eight pixels per byte, where 1 is black.
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.file = open(path, 'r+b' if writable else 'rb')
+        self.map = mmap.mmap(
+            self.file.fileno(), 0,
+            access=(mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ),
+        )
+        self.magic, self.width, self.height, self.maxval, self.offset = read_pnm_header(self.map)
+        if len(self.map) < self.offset + self.stride * self.height:
+            raise Exception(f'truncated PNM image {path}')
+        self.scale = None
+
+    @classmethod
+    def create(cls, path, magic, width, height, maxval=255):
+        """
+        Create a new image at path with all samples 0, which is black for
+        P5 and P6 images but white for P4 images.
+        """
+        header = magic + f'\n{width} {height}\n'.encode()
+        if magic != b'P4':
+            header += f'{maxval}\n'.encode()
+        with open(path, 'wb') as file:
+            file.write(header)
+            file.truncate(len(header) + cls.row_size(magic, width, maxval) * height)
+        return cls(path, writable=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    @staticmethod
+    def row_size(magic, width, maxval):
+        if magic == b'P4':
+            return (width + 7) // 8
+        channels = 3 if magic == b'P6' else 1
+        return width * channels * (2 if maxval > 255 else 1)
+
+    @property
+    def stride(self):
+        return self.row_size(self.magic, self.width, self.maxval)
+
+    @property
+    def channels(self):
+        return 3 if self.magic == b'P6' else 1
+
+    def row(self, y):
+        start = self.offset + y * self.stride
+        return self.map[start:start + self.stride]
+
+    def set_row(self, y, data):
+        assert(len(data) == self.stride)
+        start = self.offset + y * self.stride
+        self.map[start:start + self.stride] = data
+
+    def __getitem__(self, xy):
+        x, y = xy
+        start = self.offset + y * self.stride
+        if self.magic == b'P4':
+            return (self.map[start + x // 8] >> (7 - x % 8)) & 1
+        size = 2 if self.maxval > 255 else 1
+        start += x * self.channels * size
+        samples = [
+            int.from_bytes(self.map[start + i*size:start + (i+1)*size], 'big')
+            for i in range(self.channels)
+        ]
+        return samples[0] if self.channels == 1 else tuple(samples)
+
+    def __setitem__(self, xy, value):
+        x, y = xy
+        start = self.offset + y * self.stride
+        if self.magic == b'P4':
+            bit = 1 << (7 - x % 8)
+            byte = self.map[start + x // 8]
+            self.map[start + x // 8] = (byte | bit) if value else (byte & ~bit)
+            return
+        size = 2 if self.maxval > 255 else 1
+        start += x * self.channels * size
+        values = [value] if self.channels == 1 else value
+        for i, v in enumerate(values):
+            self.map[start + i*size:start + (i+1)*size] = v.to_bytes(size, 'big')
+
+    def lut(self, function, maxval=None):
+        """
+        Return a translation table for 8-bit samples that maps every value v
+        to function(v), for use with bytes.translate.
+
+        If maxval: results are clamped to it instead of the image's maxval.
+        """
+        assert(self.magic != b'P4' and self.maxval <= 255)
+        maxval = self.maxval if maxval is None else maxval
+        return bytes(max(0, min(maxval, int(function(v)))) if v <= self.maxval else v for v in range(256))
+
+    def apply(self, table):
+        """Apply a translation table to every sample of the image in place."""
+        for y in range(self.height):
+            self.set_row(y, self.row(y).translate(table))
+
+    def rescale(self, row, maxval):
+        """Return a row of 16-bit samples scaled from 0..self.maxval to 0..maxval."""
+        if self.scale is None or self.scale[0] != maxval:
+            # A table of all 16-bit values is faster than arithmetic per sample.
+            self.scale = (maxval, [min(maxval, v * maxval // self.maxval) for v in range(1 << 16)])
+        samples = array.array('H', row)
+        if sys.byteorder == 'little':
+            samples.byteswap()
+        samples = array.array('H', map(self.scale[1].__getitem__, samples))
+        if sys.byteorder == 'little':
+            samples.byteswap()
+        return samples.tobytes()
+
+    def save_png(self, path, table=None):
+        """
+        Write the image losslessly as PNG to path, optionally applying a
+        translation table to all samples first. The table must map 8-bit
+        samples to 0..255, as they are written as is.
+        """
+        if self.magic == b'P4':
+            # PNG stores 0 as black, so all bits are inverted.
+            depth, color = 1, 0
+            table = bytes(255 - v for v in range(256))
+        else:
+            depth = 16 if self.maxval > 255 else 8
+            color = 2 if self.magic == b'P6' else 0
+            if depth == 8 and self.maxval != 255 and table is None:
+                table = self.lut(lambda v: v * 255 // self.maxval, 255)
+        compressor = zlib.compressobj(6)
+        chunks = []
+        for y in range(self.height):
+            row = self.row(y)
+            if table is not None:
+                row = row.translate(table)
+            elif depth == 16 and self.maxval != 65535:
+                row = self.rescale(row, 65535)
+            chunks.append(compressor.compress(b'\x00' + row))
+        chunks.append(compressor.flush())
+
+        def chunk(tag, data):
+            return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+        with open(path, 'wb') as file:
+            file.write(b'\x89PNG\r\n\x1a\n')
+            file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, depth, color, 0, 0, 0)))
+            file.write(chunk(b'IDAT', b''.join(chunks)))
+            file.write(chunk(b'IEND', b''))
+
+
+class PNMConvert(Processor):
+    """
+    Convert PNM images to PNG within scanbro, which is lossless and does not
+    require starting ImageMagick for every page.
+
+    The profiles are simple filters that are applied to every sample.
+    """
+
+    binary = 'pnm'
+    filetype = 'png'
+    accepts = ['pnm']
+    profiles = Option('original', {
+        'original': [],
+        'level':    ['10%', '90%'],
+    })
+
+    def __init__(self, profile=None):
+        self.profile = profile
+
+    def command(self, input_files, output_file):
+        assert(type(input_files) is list and len(input_files) == 1)
+        cmd = [self.binary, input_files[0], output_file]
+        cmd.extend(self.profiles.args(self.profile))
+        return cmd
+
+    def is_conversion(self):
+        return self.profiles.args(self.profile) == []
+
+    def execute(self, cmd, input_files, output_file, stdin=None, stdout=None):
+        return self.run_func(self.convert, input_files[0], output_file, self.profiles.args(self.profile))
+
+    @staticmethod
+    def convert(input_file, output_file, levels):
+        with PNMImage(input_file) as image:
+            table = None
+            if len(levels) == 2 and image.magic != b'P4' and image.maxval <= 255:
+                black = image.maxval * float(levels[0].rstrip('%')) / 100
+                white = image.maxval * float(levels[1].rstrip('%')) / 100
+                table = image.lut(lambda v: (v - black) * 255 / (white - black), 255)
+            image.save_png(output_file, table)
+
+
+class BlankFilter(Processor):
+    """
+    Drop blank pages, such as the backsides of duplex scans, before any
+    expensive stages process them.
+
+    A page is blank if the fraction of dark pixels is at most threshold.
+    A margin around the page is ignored, since the edges of a scanned
+    sheet often cast a shadow. This requires PNM input.
+    """
+
+    binary = 'blank'
+    filetype = 'pnm'
+    accepts = ['pnm']
+    selects = True
+
+    def __init__(self, threshold=0.003, margin=0.05):
+        self.threshold = threshold
+        self.margin = margin
+
+    def signature(self):
+        return [self.binary, f'threshold={self.threshold}', f'margin={self.margin}']
+
+    def coverage(self, file):
+        """Return the fraction of dark pixels within the margins of file."""
+        with PNMImage(file) as image:
+            if image.maxval > 255:
+                raise Exception(f'unsupported PNM depth in {file}')
+            width, height = image.width, image.height
+            mx = int(width * self.margin)
+            my = int(height * self.margin)
+            ink = 0
+            if image.magic == b'P4':
+                # The margins need not be aligned to bytes, so the bits of
+                # the content area are masked in the bytes that hold it.
+                count = max(0, width - 2*mx)
+                start, end = mx // 8, (width - mx + 7) // 8
+                mask = ((1 << count) - 1) << ((end - start) * 8 - mx % 8 - count)
+                for y in range(my, height - my):
+                    row = image.row(y)[start:end]
+                    ink += (int.from_bytes(row, 'big') & mask).bit_count()
+                total = (height - 2*my) * count
+            else:
+                # Map every sample to 1 if it is dark and count these, which
+                # runs over whole rows at a time in C.
+                channels = image.channels
+                dark = image.lut(lambda v: 1 if 2*v < image.maxval else 0)
+                for y in range(my, height - my):
+                    row = image.row(y)[mx*channels:(width - mx)*channels]
+                    ink += row.translate(dark).count(1)
+                total = (height - 2*my) * (width - 2*mx) * channels
+        return ink / total if total > 0 else 0.0
+
+    def keep(self, file, dryrun=False):
+        if dryrun:
+            return True
+        coverage = self.coverage(file)
+        if coverage <= self.threshold:
+            Color.info(f'Drop blank page {file} ({coverage:.2%} ink)')
+            return False
+        return True
+
+
+class DuplicateFilter(Processor):
+    """
+    Drop pages that look like an earlier page, such as sheets that the ADF
+    fed twice or that were scanned again, before any expensive stages
+    process them.
+
+    Pages are compared by a difference hash: the page is reduced to a grid
+    of size+1 by size cells, and every bit tells whether a cell is darker
+    than its right neighbor. A page is a duplicate if at most threshold of
+    these bits differ from an earlier page. This requires PNM input.
+
+    If keep_duplicates is True, duplicates are only reported.
+    """
+
+    binary = 'duplicate'
+    filetype = 'pnm'
+    accepts = ['pnm']
+    selects = True
+    ordered = True
+    size = 8
+
+    def __init__(self, threshold=10, keep_duplicates=False, hashes=None):
+        self.threshold = threshold
+        self.keep_duplicates = keep_duplicates
+        self.hashes = hashes if hashes is not None else HashCache()
+        self.fingerprints = {}
+        self.pages = []
+
+    def signature(self):
+        return [self.binary, f'size={self.size}', f'threshold={self.threshold}', f'keep={self.keep_duplicates}']
+
+    def fingerprint(self, file):
+        """Return the difference hash of file as an integer of size*size bits."""
+        size = self.size
+        with PNMImage(file) as image:
+            if image.maxval > 255:
+                raise Exception(f'unsupported PNM depth in {file}')
+            width, height = image.width, image.height
+            # Cell boundaries in pixels of a row for bitmaps, which are
+            # counted bit by bit, and in bytes of a row otherwise.
+            if image.magic == b'P4':
+                columns = [round(i * width / (size + 1)) for i in range(size + 2)]
+                pixels = [b - a for a, b in zip(columns, columns[1:])]
+            else:
+                columns = [round(i * width / (size + 1)) * image.channels for i in range(size + 2)]
+                pixels = [b - a for a, b in zip(columns, columns[1:])]
+            rows = [round(j * height / size) for j in range(size + 1)]
+            # A few rows of every cell are enough for the average.
+            step = max(1, height // (size * 16))
+            value = 0
+            for top, bottom in zip(rows, rows[1:]):
+                ink = [0] * (size + 1)
+                for y in range(top, bottom, step):
+                    row = image.row(y)
+                    if image.magic == b'P4':
+                        bits, length = int.from_bytes(row, 'big'), 8 * len(row)
+                        for i in range(size + 1):
+                            cell = (bits >> (length - columns[i + 1])) & ((1 << pixels[i]) - 1)
+                            ink[i] += cell.bit_count()
+                    else:
+                        for i in range(size + 1):
+                            cell = row[columns[i]:columns[i + 1]]
+                            ink[i] += image.maxval * len(cell) - sum(cell)
+                count = len(range(top, bottom, step))
+                mean = [ink[i] / max(1, pixels[i] * count) for i in range(size + 1)]
+                for i in range(size):
+                    value = (value << 1) | (mean[i] > mean[i + 1])
+        return value
+
+    def prepare(self, file, dryrun=False):
+        if dryrun:
+            return
+        if file not in self.fingerprints:
+            self.fingerprints[file] = self.hashes.get(file, f'dhash{self.size}', self.fingerprint)
+        return self.fingerprints[file]
+
+    def keep(self, file, dryrun=False):
+        if dryrun:
+            return True
+        fingerprint = self.prepare(file)
+        for other, h in self.pages:
+            distance = (fingerprint ^ h).bit_count()
+            if distance > self.threshold:
+                continue
+            if not self.keep_duplicates:
+                Color.info(f'Drop duplicate page {file} of {other} ({distance} bits differ)')
+                return False
+            Color.info(f'Page {file} is a duplicate of {other} ({distance} bits differ)')
+            break
+        self.pages.append((file, fingerprint))
+        return True
+
+
+class Tesseract(Processor):
+    """
+    Create a searchable PDF by using the Tesseract OCR system.
+
+    If batch is True, all input files are recognized by a single tesseract
+    process, which creates one PDF for all of them. This avoids starting
+    tesseract and loading the language model once for every page.
+
+    If text is True, the recognized text is also written to a text file
+    next to the PDF, with the pages separated by form feeds.
+    """
+
+    binary = 'tesseract'
     filetype = 'pdf'
+    accepts = ['pnm', 'tiff', 'png', 'jpeg']
+    max_threads = 4
+    thread_env = 'OMP_THREAD_LIMIT'
+    pipe_in = 'stdin'
 
-    def __init__(self, language='deu'):
+    def __init__(self, language='deu', batch=False, text=False):
         Processor.__init__(self)
         self.language = language
+        self.text = text
+        if batch:
+            self.multiple_in = 0
+
+    def list_file(self, output_file):
+        return with_suffix(output_file, 'list')
+
+    def text_file(self, output_file):
+        return with_suffix(output_file, 'txt')
+
+    def sidecars(self, output_file):
+        return [self.text_file(output_file)] if self.text else []
 
     def command(self, input_files, output_file):
-        assert(type(input_files) is list and len(input_files) == 1)
-        input_file = input_files[0]
+        assert(type(input_files) is list and len(input_files) > 0)
+        assert(self.multiple_in != 1 or len(input_files) == 1)
+        if len(input_files) == 1:
+            input_file = input_files[0]
+        else:
+            # Tesseract reads the images from a file with one path per line.
+            input_file = self.list_file(output_file)
         if has_suffix(output_file, self.filetype):
             output_file = output_file[:-(len(self.filetype)+1)]
         cmd = [self.binary, input_file, output_file]
@@ -508,8 +2319,25 @@ class Tesseract(Processor):
         # Default is to use two algorithms (2) but that segfaults sometimes.
         cmd.extend(['--oem', '1'])
         cmd.extend([self.filetype])
+        if self.text:
+            cmd.extend(['txt'])
         return cmd
 
+    def process(self, input_files, output_file, dryrun=False, stdin=None, stdout=None):
+        assert(type(input_files) is list and len(input_files) > 0)
+        if len(input_files) == 1:
+            return Processor.process(self, input_files, output_file, dryrun, stdin, stdout)
+        list_file = self.list_file(output_file)
+        Color.debug(f'write {list_file}', dryrun)
+        if not dryrun:
+            with open(list_file, 'w') as file:
+                file.writelines(f + '\n' for f in input_files)
+        try:
+            Processor.process(self, input_files, output_file, dryrun, stdin, stdout)
+        finally:
+            if not dryrun:
+                os.remove(list_file)
+
 class ImageMagick(Processor):
     """
     Compress the image with ImageMagick.
@@ -520,6 +2348,9 @@ class ImageMagick(Processor):
 
     binary = 'convert'
     filetype = 'png'
+    accepts = ['pnm', 'tiff', 'png', 'jpeg']
+    pipe_in = '-'
+    pipe_out = 'png:-'
     profiles = Option('original', {
         'original': [],
         'scan':     ["-normalize", "-level", "10%,90%", "-sharpen", "0x1"],
@@ -541,6 +2372,9 @@ class ImageMagick(Processor):
         self.profile = profile
         self.quality = quality
 
+    def is_conversion(self):
+        return self.profiles.args(self.profile) == [] and self.qualities.args(self.quality) == []
+
     def command(self, input_files, output_file):
         assert(type(input_files) is list and len(input_files) == 1)
         input_file = input_files[0]
@@ -564,6 +2398,7 @@ class Ghostscript(Processor):
 
     binary = 'gs'
     filetype = 'pdf'
+    accepts = ['pdf']
     multiple_in = 0
     profiles = Option('high', {
         # Default profiles:
@@ -609,12 +2444,66 @@ class Ghostscript(Processor):
         ],
     })
 
-    def __init__(self, profile='high', benchmark=False):
+    # Settings tried to meet a target size, from highest to lowest quality.
+    # Only those not better than the selected profile are tried.
+    target_ladder = [
+        ('color', 300),
+        ('color', 200),
+        ('color', 150),
+        ('color', 125),
+        ('color', 100),
+        ('gray', 150),
+        ('gray', 100),
+        ('gray', 75),
+        ('gray', 50),
+    ]
+    target_sample = 5
+    target_attempts = 3
+
+    def __init__(self, profile='high', benchmark=False, benchmark_json=None, target_size=None):
         self.profile = profile
         self.benchmark = benchmark
+        self.benchmark_json = benchmark_json
+        self.target_size = target_size
 
-    def command(self, input_files, output_file):
+    def target_args(self, strategy, resolution):
+        """Return the arguments of the selected profile, changed to strategy and resolution."""
+        replaced = (
+            '-dColorImageResolution=',
+            '-dGrayImageResolution=',
+            '-dMonoImageResolution=',
+            '-sColorConversionStrategy',
+        )
+        args = [a for a in self.profiles.args(self.profile) if not a.startswith(replaced)]
+        args.extend([
+            f'-dColorImageResolution={resolution}',
+            f'-dGrayImageResolution={resolution}',
+            f'-dMonoImageResolution={resolution}',
+        ])
+        if strategy == 'gray':
+            args.extend([
+                '-sColorConversionStrategy=Gray',
+                '-sColorConversionStrategyForImages=Gray',
+            ])
+        return args
+
+    def target_candidates(self):
+        """Return the settings of target_ladder that are not better than the selected profile."""
+        args = self.profiles.args(self.profile)
+        resolution = 300
+        for a in args:
+            if a.startswith('-dColorImageResolution='):
+                resolution = int(a.partition('=')[2])
+        gray = '-sColorConversionStrategy=Gray' in args
+        return [
+            (strategy, dpi) for strategy, dpi in self.target_ladder
+            if dpi <= resolution and (strategy == 'gray' or not gray)
+        ]
+
+    def command(self, input_files, output_file, profile=None, args=None):
         assert(type(input_files) is list and len(input_files) > 0)
+        if profile is None:
+            profile = self.profile
         cmd = [
             self.binary,
             '-dNOPAUSE',
@@ -625,31 +2514,489 @@ class Ghostscript(Processor):
             '-dCompatibilityLevel=1.7',
             f'-sOutputFile={output_file}',
         ]
-        cmd.extend(self.profiles.args(self.profile))
+        cmd.extend(self.profiles.args(profile) if args is None else args)
         cmd.extend(input_files)
         return cmd
 
+    def signature(self):
+        signature = Processor.signature(self)
+        if self.target_size is not None:
+            signature.append(f'target-size={self.target_size}')
+        return signature
+
     def process(self, input_files, output_file, dryrun=False, stdin=None, stdout=None):
         assert(type(input_files) is list and len(input_files) > 0)
         if self.benchmark:
-            Color.print('Ghostscript benchmark requested.')
-            Color.print('--------------------------------')
-            original_profile = self.profile
-            for profile in self.profiles.choices:
-                self.profile = profile
-                profile_output = with_presuffix(output_file, profile)
-                Color.print(f'Create {profile_output}')
-                cmd = self.command(input_files, profile_output)
-                Color.debug(' '.join(cmd), dryrun)
-                if not dryrun:
-                    self.run_cmd(cmd, None, None)
-            Color.print('--------------------------------')
-            self.profile = original_profile
+            self.run_benchmark(input_files, output_file, dryrun)
+        elif self.target_size is not None:
+            self.run_target(input_files, output_file, dryrun)
         else:
             Processor.process(self, input_files, output_file, dryrun, stdin, stdout)
 
+    def run_benchmark(self, input_files, output_file, dryrun=False):
+        """
+        Create output_file with every profile at the same time, and report
+        the time taken and the compression achieved by each.
 
-def scanbro(scanner, pipeline, output_name, clean=0, exclude=[], interactive=False, dryrun=False):
+        The output of each profile is stored next to output_file, and the
+        regular output_file is created with the selected profile.
+        """
+        Color.print('Ghostscript benchmark requested.')
+        Color.print('--------------------------------')
+        selected = self.profile if self.profile is not None else self.profiles.default
+        async def run_profile(profile):
+            profile_output = output_file
+            if profile != selected:
+                profile_output = with_presuffix(output_file, profile)
+            Color.print(f'Create {profile_output}')
+            cmd = self.command(input_files, profile_output, profile)
+            Color.debug(' '.join(cmd), dryrun)
+            if dryrun:
+                return None
+            usage = await self.run_cmd_async(cmd, timeout=self.timeout)
+            self.trace(cmd, usage, input_files, [profile_output])
+            return {
+                'profile': profile,
+                'output': profile_output,
+                'wall': usage.wall,
+                'cpu': usage.cpu(),
+                'size': os.path.getsize(profile_output),
+            }
+        profiles = list(self.profiles.choices)
+        results = asyncio.run(run_tasks(run_profile, profiles, len(profiles)))
+        Color.print('--------------------------------')
+        if dryrun:
+            return
+
+        input_size = sum(os.path.getsize(f) for f in input_files)
+        for r in results:
+            r['ratio'] = input_size / r['size'] if r['size'] > 0 else 0.0
+        Color.print(f"{'profile':<10} {'wall [s]':>9} {'cpu [s]':>9} {'size':>9} {'ratio':>7}", prefix='   ')
+        for r in results:
+            Color.print(
+                f"{r['profile']:<10} {r['wall']:>9.2f} {r['cpu']:>9.2f} {format_size(r['size']):>9} {r['ratio']:>6.1f}x",
+                prefix='   ',
+            )
+        if self.benchmark_json is not None:
+            Color.debug(f'write {self.benchmark_json}')
+            with open(self.benchmark_json, 'w') as file:
+                json.dump({
+                    'inputs': input_files,
+                    'input_size': input_size,
+                    'results': results,
+                }, file, indent=2)
+
+    def run_target(self, input_files, output_file, dryrun=False):
+        """
+        Create output_file with the highest quality settings whose output
+        is at most target_size bytes.
+
+        All candidate settings are tried at the same time on an evenly
+        spaced sample of the input files, and the size of the complete
+        output is estimated from the input size. The best candidate is then
+        run on all input files, and if it still misses the target, the next
+        one is tried, up to target_attempts times. If the sample is all of
+        the input, the trial output is used directly.
+        """
+        candidates = self.target_candidates()
+        if len(candidates) == 0:
+            raise Exception(f'profile {self.profile} has no settings to meet a target size')
+        n = len(input_files)
+        k = min(n, self.target_sample)
+        sample = [input_files[round(i * (n - 1) / max(k - 1, 1))] for i in range(k)]
+        sample = list(dict.fromkeys(sample))
+        Color.info(f'Try {len(candidates)} settings on {len(sample)} of {n} files for target size {format_size(self.target_size)}')
+
+        async def run_args(args, in_files, out_file):
+            cmd = self.command(in_files, out_file, args=args)
+            Color.debug(' '.join(cmd), dryrun)
+            if dryrun:
+                return 0
+            usage = await self.run_cmd_async(cmd, timeout=self.timeout)
+            self.trace(cmd, usage, in_files, [out_file])
+            return os.path.getsize(out_file)
+
+        with tempfile.TemporaryDirectory(prefix='scanbro-gs-', dir=os.path.dirname(output_file) or '.') as tmpdir:
+            async def run_trial(candidate):
+                strategy, resolution = candidate
+                trial_output = os.path.join(tmpdir, f'{strategy}-{resolution}.pdf')
+                return trial_output, await run_args(self.target_args(strategy, resolution), sample, trial_output)
+            trials = asyncio.run(run_tasks(run_trial, candidates, min(len(candidates), os.cpu_count() or 1)))
+            if dryrun:
+                return
+
+            scale = sum(os.path.getsize(f) for f in input_files) / max(sum(os.path.getsize(f) for f in sample), 1)
+            estimates = [size * scale for _, size in trials]
+            Color.print(f"{'strategy':<10} {'dpi':>5} {'sample':>9} {'estimate':>9}", prefix='   ')
+            for (strategy, resolution), (_, size), estimate in zip(candidates, trials, estimates):
+                Color.print(f'{strategy:<10} {resolution:>5} {format_size(size):>9} {format_size(int(estimate)):>9}', prefix='   ')
+
+            fits = [i for i, estimate in enumerate(estimates) if estimate <= self.target_size]
+            first = fits[0] if len(fits) > 0 else len(candidates) - 1
+            for i in range(first, min(first + self.target_attempts, len(candidates))):
+                strategy, resolution = candidates[i]
+                Color.info(f'Select {strategy} at {resolution} dpi, estimated {format_size(int(estimates[i]))}')
+                if len(sample) == n:
+                    Color.debug(f'mv {trials[i][0]} {output_file}')
+                    rename_file(trials[i][0], output_file)
+                    size = trials[i][1]
+                else:
+                    size = asyncio.run(run_args(self.target_args(strategy, resolution), input_files, output_file))
+                if size <= self.target_size:
+                    return
+            Color.error(f'Output {output_file} is {format_size(size)}, which exceeds the target size')
+
+
+class Planner:
+    """
+    Arrange the requested stages into a pipeline where every stage can read
+    the output of the previous one.
+
+    The scanner format is chosen to suit the first stage, stages that only
+    convert between file types are skipped when the next stage reads the
+    type directly, and where a conversion is necessary, the cheapest of the
+    converters is inserted. Converters are factories ordered by cost.
+    """
+
+    outputs = ['pdf', 'png', 'tiff', 'jpeg']
+
+    def __init__(self, converters):
+        self.converters = converters
+
+    def converter(self, filetype, accept):
+        """Return the cheapest converter from filetype to a type accept allows."""
+        for make in self.converters:
+            try:
+                c = make()
+            except Exception:
+                continue
+            if c.reads(filetype) and accept(c.filetype):
+                return c
+        raise Exception(f'cannot find a converter for {filetype}')
+
+    def plan(self, scanner, stages):
+        if len(stages) > 0 and not stages[0].reads(scanner.filetype):
+            for filetype in scanner.formats:
+                if stages[0].reads(filetype):
+                    scanner.filetype = filetype
+                    break
+
+        pipeline = []
+        current = scanner.filetype
+        for i, p in enumerate(stages):
+            following = stages[i + 1] if i + 1 < len(stages) else None
+            if p.is_conversion() and following is not None and following.reads(current):
+                Color.info(f'Skip {p.binary}, since {following.binary} reads {current}')
+                continue
+            if not p.reads(current):
+                c = self.converter(current, p.reads)
+                pipeline.append(c)
+                current = c.filetype
+            pipeline.append(p)
+            if not p.selects:
+                current = p.filetype
+        if current not in self.outputs:
+            c = self.converter(current, lambda t: t in self.outputs)
+            pipeline.append(c)
+
+        current = scanner.filetype
+        steps = [f'{scanner.binary} ({current})']
+        for p in pipeline:
+            steps.append(p.binary if p.selects else f'{p.binary} ({p.filetype})')
+        Color.info('Pipeline: ' + ' => '.join(steps))
+        return pipeline
+
+
+class Scheduler:
+    """
+    Divide a budget of cores between the processes that a stage runs at the
+    same time and the threads that each of these processes may use.
+
+    Running more processes is preferred over more threads per process, as
+    page-level parallelism scales better than the threading within the
+    processors. Overrides map a processor binary to a (jobs, threads) pair.
+    """
+
+    def __init__(self, cores=None, overrides={}):
+        if cores is None:
+            cores = os.cpu_count() or 1
+        self.cores = cores
+        self.overrides = overrides
+        self.plans = {}
+
+    def plan(self, stage, partitions):
+        """Return (jobs, threads) for running stage on a number of partitions."""
+        if stage.binary in self.overrides:
+            jobs, threads = self.overrides[stage.binary]
+        else:
+            jobs = max(1, min(self.cores, partitions))
+            threads = max(1, min(stage.max_threads, self.cores // jobs))
+        self.plans[stage.binary] = (jobs, threads)
+        Color.info(f'Plan {stage.binary}: {jobs} jobs x {threads} threads')
+        return jobs, threads
+
+
+def parse_plan(plan: str) -> dict:
+    """Parse scheduler overrides in the form 'tesseract=4x2,gs=2x1'."""
+    if plan is None:
+        return {}
+    overrides = {}
+    for entry in plan.split(','):
+        binary, _, value = entry.partition('=')
+        jobs, _, threads = value.partition('x')
+        try:
+            overrides[binary] = (int(jobs), int(threads) if threads != '' else 1)
+        except ValueError:
+            raise Exception(f'invalid plan entry {entry}, expect BINARY=JOBSxTHREADS')
+    return overrides
+
+
+def can_pipe(a, b):
+    """Return whether single-page stage a can write directly into stage b."""
+    return (a.multiple_in == 1 and b.multiple_in == 1 and
+            not a.multiple_out and not b.multiple_out and
+            a.pipe_out is not None and b.pipe_in is not None)
+
+
+def run_pipe(stages, input_file, output_file, dryrun=False):
+    """
+    Run input_file through stages connected by pipes, so that only the last
+    stage writes a file. Stages run this way bypass the stage cache.
+    """
+    cmds = []
+    for i, p in enumerate(stages):
+        cmds.append(p.command(
+            [input_file if i == 0 else p.pipe_in],
+            output_file if i == len(stages) - 1 else p.pipe_out,
+        ))
+    Color.debug(' | '.join(' '.join(cmd) for cmd in cmds), dryrun)
+    if dryrun:
+        return
+
+    # The pipe is a single job, so it holds one slot for all its commands.
+    with Processor.slots or contextlib.nullcontext():
+        start = time.monotonic()
+        procs = []
+        scope = CancelScope.current()
+        with tempfile.TemporaryFile(mode='w+') as stderr:
+            stdin = None
+            for i, (p, cmd) in enumerate(zip(stages, cmds)):
+                proc = subprocess.Popen(
+                    cmd,
+                    stdin=stdin,
+                    stdout=(None if i == len(stages) - 1 else subprocess.PIPE),
+                    stderr=stderr,
+                    env=p.environment(),
+                )
+                # Only the child should hold the reading end of the pipe,
+                # otherwise the writer is not notified if the reader fails.
+                if stdin is not None:
+                    stdin.close()
+                stdin = proc.stdout
+                procs.append(proc)
+                if scope is not None:
+                    scope.started(proc)
+            timeouts = [p.timeout for p in stages if p.timeout is not None]
+            timeout = max(timeouts) if len(timeouts) > 0 else None
+            async def exited():
+                await asyncio.gather(*[Processor.exited(proc) for proc in procs])
+            try:
+                asyncio.run(asyncio.wait_for(exited(), timeout))
+            except asyncio.TimeoutError:
+                for proc in procs:
+                    proc.kill()
+                    Processor.wait_cmd(proc, start)
+                raise Exception(f'{" | ".join(p.binary for p in stages)} was killed after running for {timeout} seconds')
+            finally:
+                if scope is not None:
+                    for proc in procs:
+                        scope.finished(proc)
+            usages = [Processor.wait_cmd(proc, start) for proc in procs]
+            if scope is not None and scope.cancelled:
+                raise Exception(f'{" | ".join(p.binary for p in stages)} was killed because another job failed')
+            for i, (p, cmd, usage) in enumerate(zip(stages, cmds, usages)):
+                p.trace(
+                    cmd, usage,
+                    [input_file] if i == 0 else [],
+                    [output_file] if i == len(stages) - 1 else [],
+                )
+            if any(proc.returncode != 0 for proc in procs):
+                stderr.seek(0)
+                Color.error("Error:")
+                print(stderr.read())
+                raise ChildProcessError()
+
+
+def remove_file(file, dryrun=False):
+    # A file may already be gone if the stage that used it was resumed.
+    if dryrun or os.path.exists(file):
+        Color.debug(f'rm {file}', dryrun)
+        if not dryrun: os.remove(file)
+
+
+def keep_page(p, file, dryrun=False, manifest=None):
+    """Return whether the selecting stage p keeps file, as in the manifest if possible."""
+    # Ordered stages have to see every page again to decide the next.
+    if manifest is not None and not p.ordered:
+        done, output_file = manifest.lookup(p, [file])
+        if done:
+            keep = output_file is not None
+            if p.progress is not None:
+                p.progress.advance(p.binary)
+                if not keep:
+                    p.progress.drop(p.binary)
+            return keep
+    keep = p.keep(file, dryrun)
+    if manifest is not None:
+        manifest.record(p, [file], file if keep else None)
+    if p.progress is not None:
+        p.progress.advance(p.binary)
+        if not keep:
+            p.progress.drop(p.binary)
+    return keep
+
+
+def run_stages(stages, input_files, output_file, dryrun=False, manifest=None):
+    """
+    Run input_files through stages, connected by pipes if there is more
+    than one, and return the output file.
+
+    If manifest: the output recorded in it is returned if it can be reused,
+       and the output created otherwise is recorded.
+    """
+    def advance():
+        for p in stages:
+            if p.progress is not None:
+                p.progress.advance(p.binary, len(input_files))
+    if manifest is not None:
+        done, output = manifest.lookup(stages[-1], input_files)
+        if done:
+            Color.debug(f'reuse {output}', True)
+            advance()
+            return output
+    if len(stages) == 1:
+        stages[0].process(input_files, output_file, dryrun)
+    else:
+        run_pipe(stages, input_files[0], output_file, dryrun)
+    if manifest is not None:
+        manifest.record(stages[-1], input_files, output_file)
+    advance()
+    return output_file
+
+
+def process_page(stages, file, clean=0, dryrun=False, output_path=None, pipe=False, manifest=None):
+    """
+    Run a single file through stages that each take exactly one input file,
+    and return the output file of the last stage.
+
+    If clean > 0: intermediate files are deleted as soon as possible.
+
+    If output_path: it is called with the stage and its input file, and
+       returns the output file of the stage.
+
+    If pipe == True: consecutive stages that support it are connected by
+       pipes instead of intermediate files.
+
+    If manifest: steps recorded in it are not repeated.
+
+    If a stage drops the page, None is returned.
+    """
+    input_file = file
+    i = 0
+    while i < len(stages):
+        if stages[i].selects:
+            if not keep_page(stages[i], input_file, dryrun, manifest):
+                if input_file != file and clean > 0:
+                    remove_file(input_file, dryrun)
+                return None
+            i += 1
+            continue
+        chain = [stages[i]]
+        while pipe and i + len(chain) < len(stages) and can_pipe(chain[-1], stages[i + len(chain)]):
+            chain.append(stages[i + len(chain)])
+        i += len(chain)
+
+        # Name the output as if each stage in the chain had written a file.
+        name = input_file
+        for p in chain[:-1]:
+            name = p.suffix(name)
+        if output_path is None:
+            output_file = chain[-1].suffix(name)
+        else:
+            output_file = output_path(chain[-1], name)
+
+        output_file = run_stages(chain, [input_file], output_file, dryrun, manifest)
+        if input_file != file and clean > 0:
+            remove_file(input_file, dryrun)
+        input_file = output_file
+    return input_file
+
+
+def stream_pages(scanner, stages, output_name, clean=0, dryrun=False, jobs=1, output_path=None, pipe=False, device=None, manifest=None):
+    """
+    Scan from the ADF and run every page through stages while the scanner
+    is still busy with the following pages. If device is given, it is held
+    until the scanner is done, and the device it yields, if any, is used.
+
+    Ordered stages and the stages before them run for one page at a time
+    as the pages arrive, and only the remaining stages run in parallel.
+
+    Returns the scanned files and the output files of the last stage,
+    both in page order.
+    """
+    ordered = max([i + 1 for i, p in enumerate(stages) if p.ordered], default=0)
+    prototype = with_presuffix(with_suffix(output_name, scanner.filetype), '%d')
+    if scanner.exists(prototype) and clean < 3:
+        pages = scanner.output(prototype)
+    else:
+        Color.info(f"Scan from {scanner.name}")
+        pages = scanner.stream(prototype, dryrun)
+    if len(stages) > 0:
+        Color.info(f'Stream [{prototype} ...] through {" | ".join(p.binary for p in stages)}')
+
+    scanned_files = []
+    futures = []
+    scope = CancelScope()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    try:
+        with device or contextlib.nullcontext() as held:
+            if held is not None:
+                scanner.device = held
+            for file in pages:
+                Color.info(f"Read file {file}")
+                scanned_files.append(file)
+                if scanner.progress is not None:
+                    scanner.progress.advance(scanner.binary)
+                if ordered > 0:
+                    file = process_page(stages[:ordered], file, clean, dryrun, output_path, pipe, manifest)
+                    if file is None:
+                        continue
+                futures.append(executor.submit(scope.run, process_page, stages[ordered:], file, clean, dryrun, output_path, pipe, manifest))
+                for f in futures:
+                    if f.done() and f.exception() is not None:
+                        raise f.exception()
+        done, pending = concurrent.futures.wait(
+            futures, return_when=concurrent.futures.FIRST_EXCEPTION
+        )
+        for f in futures:
+            if f in done and f.exception() is not None:
+                raise f.exception()
+        output_files = [f.result() for f in futures]
+        output_files = [f for f in output_files if f is not None]
+    except BaseException:
+        scope.cancel()
+        raise
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if hasattr(pages, 'close'):
+            pages.close()
+
+    if len(scanned_files) == 0:
+        raise Exception("expected output files from scanner, found nothing")
+    return scanned_files, output_files
+
+
+def scanbro(scanner, pipeline, output_name, clean=0, exclude=[], interactive=False, dryrun=False, jobs=None, stream=False, scheduler=None, workdir=None, pipe=False, device=None, manifest=None):
     """
     Do the hard work of scanning to one or more files and processing
     these with any of the post-processing filters selected.
@@ -667,64 +3014,172 @@ def scanbro(scanner, pipeline, output_name, clean=0, exclude=[], interactive=Fal
     If interactive == True: interactively scan multiple times.
 
     If dryrun == True: commands are shown but not executed.
+
+    If jobs > 1: stages that work on single pages or groups of pages
+       process up to jobs partitions at the same time. The order of the
+       output files is the same as with jobs == 1.
+       If jobs is None: stages process one partition at a time, except
+       that stages whose partitions are documents use all cores.
+
+    If stream == True: pages from the ADF are passed to the leading stages
+       that work on single pages as soon as they have been scanned.
+       This cannot be combined with interactive or exclude.
+
+    If scheduler: it decides for every stage how many processes run at
+       the same time and how many threads each may use; jobs is ignored.
+
+    If workdir: intermediate files are created in the Workdir, and only
+       the files of the last stage are created next to output_name.
+
+    If pipe == True: consecutive single-page stages that can read from
+       stdin and write to stdout are connected by pipes, and do not write
+       intermediate files.
+
+    If device: it is held while the scanner is in use, so that several
+       calls can share one scanner. If it yields a device identifier, the
+       scanner uses that device.
+
+    If manifest: every step is recorded in the Manifest, and steps that
+       it shows to be done already are skipped.
     """
 
-    # Scan/read
-    scanned_files = scanner.scan(
-        output_name,
-        clobber=(True if clean >= 3 else False),
-        exclude=exclude,
-        interactive=interactive,
-        dryrun=dryrun,
-    )
+    def plan(p, partitions):
+        if scheduler is None:
+            return jobs or 1
+        stage_jobs, p.threads = scheduler.plan(p, partitions)
+        return stage_jobs
+
+    destination = os.path.dirname(output_name)
+    def output_path(p, file):
+        # Files read from elsewhere must not get intermediate files next
+        # to them, so these are always created next to output_name.
+        output_file = p.suffix(file)
+        if workdir is None or p is pipeline[-1]:
+            return os.path.join(destination, os.path.basename(output_file))
+        else:
+            # The output of a stage is rarely larger than its input.
+            estimate = os.path.getsize(file) if os.path.exists(file) else 0
+            return workdir.place(output_file, destination, estimate)
+
+    if manifest is not None and manifest.complete():
+        Color.info(f'Already complete according to {manifest.path}')
+        return manifest.final
 
-    # Print the filenames of the input files.
-    if len(scanned_files) == 1:
-        Color.info(f"Read file {scanned_files[0]}")
+    stage = 0
+    if stream:
+        if not scanner.is_adf() or interactive or len(exclude) > 0:
+            raise Exception('streaming requires ADF scanning without interactive or exclude')
+        head = []
+        for p in pipeline:
+            if p.multiple_in != 1 or p.multiple_out:
+                break
+            head.append(p)
+        # The number of pages is not known in advance, so plan for as many
+        # pages as there are cores.
+        stream_jobs = jobs or 1
+        if scheduler is not None:
+            stream_jobs = max([1] + [plan(p, scheduler.cores) for p in head])
+        scanned_files, input_files = stream_pages(scanner, head, output_name, clean, dryrun, stream_jobs, output_path, pipe, device, manifest)
+        stage = len(head)
+        if workdir is not None:
+            workdir.release()
     else:
-        Color.info("Read files:")
-        for file in scanned_files:
-            print(f"   {file}")
+        # Scan/read
+        with device or contextlib.nullcontext() as held:
+            if held is not None:
+                scanner.device = held
+            scanned_files = scanner.scan(
+                output_name,
+                clobber=(True if clean >= 3 else False),
+                exclude=exclude,
+                interactive=interactive,
+                dryrun=dryrun,
+            )
+        input_files = scanned_files
+        if scanner.progress is not None:
+            scanner.progress.advance(scanner.binary, len(scanned_files))
+
+        # Print the filenames of the input files.
+        if len(scanned_files) == 1:
+            Color.info(f"Read file {scanned_files[0]}")
+        else:
+            Color.info("Read files:")
+            for file in scanned_files:
+                print(f"   {file}")
 
     # Quit early if there are no stages in the pipeline.
     if len(pipeline) == 0:
         return scanned_files
+    if scanner.progress is not None:
+        scanner.progress.expect(len(scanned_files), [scanner.binary] + [p.binary for p in pipeline])
 
     # Apply post-processing:
-    stage = 0
-    input_files = scanned_files
-    for p in pipeline:
-        stage += 1
-        if p.multiple_in <= 0:
+    scanned = set(scanned_files)
+    while stage < len(pipeline):
+        p = pipeline[stage]
+        chain = [p]
+        while pipe and stage + len(chain) < len(pipeline) and can_pipe(chain[-1], pipeline[stage + len(chain)]):
+            chain.append(pipeline[stage + len(chain)])
+        stage += len(chain)
+        if p.selects:
+            if p.ordered:
+                run_parallel(lambda f: p.prepare(f, dryrun), input_files, plan(p, len(input_files)))
+                keep = [keep_page(p, f, dryrun, manifest) for f in input_files]
+            else:
+                keep = run_parallel(lambda f: keep_page(p, f, dryrun, manifest), input_files, plan(p, len(input_files)))
+            output_files = [f for f, k in zip(input_files, keep) if k]
+            if clean > 0:
+                for file in input_files:
+                    if file not in output_files and file not in scanned:
+                        remove_file(file, dryrun)
+            if len(output_files) == 0:
+                raise Exception('all pages were dropped')
+            input_files = output_files
+            continue
+        elif len(chain) > 1:
+            Color.info(f'Pipe [{input_files[0]} ...] through {" | ".join(q.binary for q in chain)}')
+            chain_jobs = min(plan(q, len(input_files)) for q in chain)
+            def process_chain(file):
+                return process_page(chain, file, 0, dryrun, output_path, pipe, manifest)
+            output_files = run_parallel(process_chain, input_files, chain_jobs)
+        elif p.multiple_in <= 0:
             # Currently, only the scanner can create multiple output files,
             # so we assume that multiple in means single out.
             assert(not p.multiple_out)
             part = input_files[0].rpartition('.1')
-            output_files = [ p.suffix(part[0] + part[2]) ]
-            Color.info(f'Transform [{input_files[0]} ...] => {prototype}')
-            p.process(input_files, output_files[0], dryrun)
+            output_files = [ output_path(p, part[0] + part[2]) ]
+            Color.info(f'Transform [{input_files[0]} ...] => {output_files[0]}')
+            plan(p, 1)
+            output_files = [ run_stages([p], input_files, output_files[0], dryrun, manifest) ]
         else:
             # In this case, we will be creating multiple_out even if it's
             # not explicitely specified. Instead, we will be partitioning
             # the input files in multiples and converting these into
             # output.
-            output_files = []
-            prototype = p.suffix(input_files[0])
+            prototype = output_path(p, input_files[0])
             n = len(input_files)
             if n % p.multiple_in != 0:
                 raise Exception(f'input files {n} cannot be cleanly partitioned in {p.multiple_in}')
             Color.info(f'Transform /{p.multiple_in} [{input_files[0]} ...] => [{prototype} ...]')
             partitioned_files = [input_files[i:i + p.multiple_in] for i in range(0, n, p.multiple_in)]
-            for in_files in partitioned_files:
-                out_file = p.suffix(in_files[0])
-                output_files.append(out_file)
-                p.process(in_files, out_file, dryrun)
+            def process_partition(in_files):
+                return run_stages([p], in_files, output_path(p, in_files[0]), dryrun, manifest)
+            partition_jobs = plan(p, len(partitioned_files))
+            if scheduler is None and jobs is None and p.documents:
+                # Groups are separate documents, and a single-threaded stage
+                # gains nothing from cores left idle, so use all of them.
+                partition_jobs = min(os.cpu_count() or 1, len(partitioned_files))
+            output_files = run_parallel(process_partition, partitioned_files, partition_jobs)
+
+        if workdir is not None:
+            workdir.release()
 
         # Remove intermediate files if requested
-        if stage > 1 and clean > 0:
+        if clean > 0:
             for file in input_files:
-                Color.debug(f'rm {file}', dryrun)
-                if not dryrun: os.remove(file)
+                if file in scanned:
+                    continue
+                remove_file(file, dryrun)
 
         # The output of this stage is the input for the next stage
         input_files = output_files
@@ -735,7 +3190,10 @@ def scanbro(scanner, pipeline, output_name, clean=0, exclude=[], interactive=Fal
     def move_file(file, output_file):
         final_output.append(output_file)
         Color.debug(f'mv {file} {output_file}', dryrun)
-        if not dryrun: shutil.move(file, output_file)
+        if not dryrun:
+            rename_file(file, output_file)
+            # Stages that hit the StageCache link their output to it.
+            unshare_file(output_file)
     if len(input_files) == 1:
         # If we only have one file, we don't add an index
         output_file = with_suffix(output_name, final_suffix)
@@ -754,6 +3212,8 @@ def scanbro(scanner, pipeline, output_name, clean=0, exclude=[], interactive=Fal
             Color.debug(f'rm {file}', dryrun)
             if not dryrun: os.remove(file)
 
+    if manifest is not None:
+        manifest.finish(final_output, input_files)
     return final_output
 
 
@@ -827,27 +3287,314 @@ def parse_exclude(exclude: str) -> list:
     return entries
 
 
-if __name__ == "__main__":
+def parse_scanner_options(text):
+    """
+    Parse the output of scanimage -A into a dict that maps every option
+    flag to its values and default value.
+    """
+    options = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith('-'):
+            continue
+        flag, _, rest = line.partition(' ')
+        default = None
+        i = rest.rfind(' [')
+        if i != -1 and rest.endswith(']'):
+            rest, default = rest[:i], rest[i+2:-1]
+        rest = re.sub(r'\s*\(in steps of [^)]*\)$', '', rest)
+        options[flag] = {'values': rest.split('|'), 'default': default}
+    return options
+
+
+def parse_range(values):
+    """Return the bounds of a range such as 0..215.9mm, or None."""
+    match = re.match(r'^(-?[\d.]+)\.\.(-?[\d.]+)', values[0]) if len(values) == 1 else None
+    if match is None:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+
+def option_choices(flag, values, aliases):
+    """
+    Return the choices of an Option for the values of a scanimage option.
+    Every value has a short name, and every alias names the shortest value
+    that matches its pattern.
+    """
+    choices = {}
+    for value in values:
+        choices[re.sub(r'[^a-z0-9]+', '-', value.lower()).strip('-')] = [flag, value]
+    for alias, pattern in aliases.items():
+        matches = [v for v in values if re.search(pattern, v, re.IGNORECASE)]
+        if len(matches) > 0 and alias not in choices:
+            choices[alias] = [flag, min(matches, key=len)]
+    return choices
+
+
+def option_default(choices, value):
+    """Return the name of value in choices, preferring an alias."""
+    names = [k for k, v in choices.items() if len(v) == 2 and v[1] == value]
+    return names[-1] if len(names) > 0 else None
+
+
+class DeviceCache:
+    """
+    Keep the devices found by scanimage -L and the options that scanimage -A
+    reports for each device in a JSON file, since discovering scanners on
+    the network takes several seconds every time.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(cache_home(), 'devices.json')
+        self.path = path
+        self.state = {'devices': None, 'options': {}}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.state = json.load(file)
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as file:
+            json.dump(self.state, file, indent=2)
+        os.replace(temp, self.path)
+
+    @staticmethod
+    def query(cmd):
+        Color.debug(' '.join(cmd))
+        return subprocess.run(cmd, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+    def devices(self, refresh=False):
+        if self.state['devices'] is None or refresh:
+            output = self.query(['scanimage', '-L'])
+            self.state['devices'] = [
+                {'device': m.group(1), 'name': m.group(2)}
+                for m in re.finditer(r"^device `(.*)' is a (.*)$", output, re.MULTILINE)
+            ]
+            self.write()
+        return self.state['devices']
+
+    def options(self, device, refresh=False):
+        if device not in self.state['options'] or refresh:
+            output = self.query(['scanimage', '-A', '--device-name', device])
+            self.state['options'][device] = parse_scanner_options(output)
+            self.write()
+        return self.state['options'][device]
+
+
+def make_backend(device, name, options):
+    """Create a Scanner class for device from its options as parsed from scanimage -A."""
+    def option(flag):
+        return options.get(flag, {'values': [], 'default': None})
+
+    modes = option_choices('--mode', option('--mode')['values'], {
+        'bw': r'lineart|black|binary',
+        'gray': r'gr[ae]y',
+        'color': r'colou?r',
+    })
+    sources = option_choices('--source', option('--source')['values'], {
+        'flatbed': r'flatbed',
+        'adf': r'^(?!.*duplex).*(adf|feeder)',
+        'duplex': r'duplex',
+    })
+    resolutions = option('--resolution')
+    bounds = parse_range(resolutions['values'])
+    if bounds is None:
+        dpis = [re.sub(r'dpi$', '', v) for v in resolutions['values'] if v != '']
+    else:
+        dpis = [str(r) for r in [75, 100, 150, 200, 300, 400, 600, 1200, 2400, 4800, 9600] if bounds[0] <= r <= bounds[1]]
+    width, height = parse_range(option('-x')['values']), parse_range(option('-y')['values'])
+    area = Papersize(width[1] if width else float('inf'), height[1] if height else float('inf'))
+    papersizes = {p: PAPERSIZES[p] for p in PAPERSIZES if area.can_cover(PAPERSIZES[p])}
+
+    return type('SANE_' + re.sub(r'\W+', '_', name), (Scanner,), {
+        'name': name,
+        'device': device,
+        'papersizes': Option('a4' if 'a4' in papersizes else None, papersizes),
+        'modes': Option(option_default(modes, option('--mode')['default']), modes),
+        'resolutions': Option(
+            re.sub(r'dpi$', '', resolutions['default'] or '') or None,
+            {dpi: ['--resolution', dpi] for dpi in dpis},
+        ),
+        'sources': Option('auto', {'auto': [], **sources}),
+        'duplex_sources': [k for k, v in sources.items() if 'duplex' in v[1].lower()],
+    })
+
+
+def discover_backend(device=None, refresh=False):
+    """
+    Return a Scanner class for device, or for the first device found if
+    none is given, from the device cache unless refresh is True.
+    """
+    cache = DeviceCache()
+    if device is None:
+        devices = cache.devices(refresh)
+        if len(devices) == 0:
+            raise Exception('expected a scanner from scanimage -L, found nothing')
+        device = devices[0]['device']
+    names = {d['device']: d['name'] for d in cache.state['devices'] or []}
+    return make_backend(device, names.get(device, device), cache.options(device, refresh))
+
+
+# Scanner options:
+SCANNERS = {
+    'brother': Brother_MFC_J5730DW,
+    'simulated': SimulatedScanner,
+}
+def make_scanner(args):
+    if args.backend == 'sane':
+        backend = discover_backend(args.device, args.refresh_devices)
+    else:
+        backend = SCANNERS[args.backend]
+    # The choices depend on the backend, so they are only checked here.
+    preferred = {'papersize': 'a4', 'resolution': '300'}
+    config = {}
+    for key, option in [('papersize', backend.papersizes), ('mode', backend.modes),
+                        ('resolution', backend.resolutions), ('source', backend.sources)]:
+        value = getattr(args, key)
+        if value is None:
+            if preferred.get(key) in option.choices:
+                value = preferred[key]
+        elif value not in option.choices:
+            raise Exception(f"unknown {key} {value} for {backend.name}, require one of {', '.join(option.choices)}")
+        config[key] = value
+    scanner = backend(config)
+    if args.device is not None:
+        scanner.device = args.device
+    return scanner
+
+
+# Post-processing options:
+def make_blank(scanner, args):
+    return BlankFilter(args.blank_threshold)
+def make_duplicate(scanner, args):
+    return DuplicateFilter(args.duplicate_threshold, args.keep_duplicates)
+def make_unpaper(scanner, args):
+    return Unpaper()
+def make_pnm(scanner, args):
+    return PNMConvert(args.pnm_profile)
+def make_imagemagick(scanner, args):
+    return ImageMagick(args.im_profile, args.convert_quality)
+def make_tesseract(scanner, args):
+    tesseract = Tesseract(args.language, args.tesseract_batch, args.index)
+    if args.tesseract_batch and args.group_by != 0:
+        tesseract.multiple_in = args.group_by
+    return tesseract
+def make_ghostscript(scanner, args):
+    target_size = parse_size(args.gs_target_size) if args.gs_target_size is not None else None
+    gs = Ghostscript(args.gs_profile, args.gs_benchmark, args.gs_benchmark_json, target_size)
+    if args.group_by != 0:
+        gs.multiple_in = args.group_by;
+        gs.documents = True
+        if args.group_by % 2 == 1 and scanner.is_duplex():
+            raise Exception('duplex scanning requires group-by to be an even number');
+        if args.tesseract_batch and 'tesseract' in args.filters:
+            # Tesseract already creates one PDF for each group.
+            gs.multiple_in = 1
+    return gs
+
+FILTERS = {
+    'blank': make_blank,
+    'duplicate': make_duplicate,
+    'unpaper': make_unpaper,
+    'pnm': make_pnm,
+    'imagemagick': make_imagemagick,
+    'tesseract': make_tesseract,
+    'ghostscript': make_ghostscript,
+}
+
+
+def make_parser():
     parser = argparse.ArgumentParser(
         description='Scan from your scanner to searchable PDF.',
     )
     parser.add_argument(
-        'output',
-        nargs='?',
-        help='output file',
+        'output',
+        nargs='?',
+        help='output file',
+    )
+    parser.add_argument(
+        '-n', '--dry-run',
+        dest='dryrun',
+        action='store_true',
+        help='show which commands would be executed',
+    )
+    parser.add_argument(
+        '-c', '--clean',
+        dest='clean',
+        default=0,
+        action='count',
+        help='clean up intermediary (1) and input (2)',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        default=None,
+        help='process up to N pages in parallel (default=1, or all cores for documents of --group-by)',
+    )
+    parser.add_argument(
+        '--cores',
+        dest='cores',
+        type=int,
+        default=None,
+        help='divide N cores between parallel pages and threads per stage',
+    )
+    parser.add_argument(
+        '--plan',
+        dest='plan',
+        default=None,
+        help='override the plan per stage, such as tesseract=4x2,gs=1x1',
     )
     parser.add_argument(
-        '-n', '--dry-run',
-        dest='dryrun',
+        '--workdir',
+        dest='workdir',
+        default=None,
+        help='keep intermediate files in this directory, such as /dev/shm',
+    )
+    parser.add_argument(
+        '--workdir-size',
+        dest='workdir_size',
+        default='1G',
+        help='spill intermediate files to disk beyond this size (default=1G)',
+    )
+    parser.add_argument(
+        '--pipe',
+        dest='pipe',
         action='store_true',
-        help='show which commands would be executed',
+        help='connect stages with pipes instead of intermediate files',
     )
     parser.add_argument(
-        '-c', '--clean',
-        dest='clean',
-        default=0,
-        action='count',
-        help='clean up intermediary (1) and input (2)',
+        '--trace',
+        dest='trace',
+        default=None,
+        help='record resource usage of every command to a JSON Lines file',
+    )
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        type=float,
+        default=None,
+        help='kill commands of the pipeline that run longer than this many seconds',
+    )
+    parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        help='continue a failed run from the steps recorded in its manifest',
+    )
+    parser.add_argument(
+        '--progress',
+        dest='progress',
+        action='store_true',
+        help='report pages per stage, rates and time left, as JSON if not on a terminal',
+    )
+    parser.add_argument(
+        '--stream',
+        dest='stream',
+        action='store_true',
+        help='process pages while the ADF is still scanning',
     )
     parser.add_argument(
         '-v', '--verify',
@@ -857,29 +3604,18 @@ if __name__ == "__main__":
     )
 
     # Scanner options:
-    DEFAULT_SCANNER = Brother_MFC_J5730DW
-    SCANNERS = {
-        'brother': Brother_MFC_J5730DW,
-    }
-    def make_scanner(args):
-        scanner = SCANNERS[args.backend]({
-            'papersize': args.papersize,
-            'mode': args.mode,
-            'resolution': args.resolution,
-            'source': args.source,
-        })
-        if args.device is not None:
-            scanner.device = args.device
-        if 'unpaper' in args.filters:
-            scanner.filetype = 'pnm'
-        return scanner
-
     parser.add_argument(
         '-b', '--backend',
         dest='backend',
         default='brother',
-        choices=SCANNERS,
-        help='backend scanner device to use (default=brother)',
+        choices=list(SCANNERS) + ['sane'],
+        help='backend scanner device to use, sane discovers it with scanimage (default=brother)',
+    )
+    parser.add_argument(
+        '--refresh-devices',
+        dest='refresh_devices',
+        action='store_true',
+        help='discover scanners and their options again instead of using the cache [sane]',
     )
     parser.add_argument(
         '-d', '--device',
@@ -890,29 +3626,25 @@ if __name__ == "__main__":
     parser.add_argument(
         '-p', '--papersize',
         dest='papersize',
-        default='a4',
-        choices=DEFAULT_SCANNER.papersizes.choices,
-        help='input scan area as paper size (default=a4)',
+        default=None,
+        help='input scan area as paper size (default=a4 if supported)',
     )
     parser.add_argument(
         '-s', '--source',
         dest='source',
         default=None,
-        choices=DEFAULT_SCANNER.sources.choices,
         help='input scan source, such as flatbed or adf',
     )
     parser.add_argument(
         '-r', '--resolution',
         dest='resolution',
-        default='300',
-        choices=DEFAULT_SCANNER.resolutions.choices,
-        help='input scan resolution, in DPI (default=300)',
+        default=None,
+        help='input scan resolution, in DPI (default=300 if supported)',
     )
     parser.add_argument(
         '-m', '--mode',
         dest='mode',
         default=None,
-        choices=DEFAULT_SCANNER.modes.choices,
         help='input scan mode, such as black&white or color',
     )
     parser.add_argument(
@@ -933,29 +3665,29 @@ if __name__ == "__main__":
         dest='exclude',
         help='exclude certain pages, with 1 as the first page and -1 as the last page',
     )
+    parser.add_argument(
+        '--from-files',
+        dest='from_files',
+        nargs='+',
+        default=[],
+        help='read pages from existing image files instead of scanning, output is a directory',
+    )
+    parser.add_argument(
+        '--from-dir',
+        dest='from_dirs',
+        default=[],
+        action='append',
+        help='read pages from the image files in this directory instead of scanning',
+    )
+    parser.add_argument(
+        '--doc-pattern',
+        dest='doc_pattern',
+        default=r'(?P<doc>.+)\.(?P<page>\d+)$',
+        help='regular expression with the groups doc and page, matched against filenames '
+             'without extension to group pages into documents (default=NAME.PAGE)',
+    )
 
     # Post-processing options:
-    def make_unpaper(scanner, args):
-        return Unpaper()
-    def make_imagemagick(scanner, args):
-        return ImageMagick(args.im_profile, args.convert_quality)
-    def make_tesseract(scanner, args):
-        return Tesseract(args.language)
-    def make_ghostscript(scanner, args):
-        gs = Ghostscript(args.gs_profile, args.gs_benchmark)
-        if args.group_by != 0:
-            gs.multiple_in = args.group_by;
-            if args.group_by % 2 == 1 and scanner.is_duplex():
-                raise Exception('duplex scanning requires group-by to be an even number');
-        return gs
-
-    FILTERS = {
-        'imagemagick': make_imagemagick,
-        'unpaper': make_unpaper,
-        'tesseract': make_tesseract,
-        'ghostscript': make_ghostscript,
-    }
-
     parser.add_argument(
         '-f', '--filter',
         dest='filters',
@@ -970,6 +3702,50 @@ if __name__ == "__main__":
         default='deu',
         help='language the input should be interpreted in [tesseract]',
     )
+    parser.add_argument(
+        '--blank-threshold',
+        dest='blank_threshold',
+        type=float,
+        default=0.003,
+        help='drop pages with at most this fraction of dark pixels (default=0.003) [blank]',
+    )
+    parser.add_argument(
+        '--duplicate-threshold',
+        dest='duplicate_threshold',
+        type=int,
+        default=10,
+        help='drop pages whose hash differs in at most this many of 64 bits from an earlier page (default=10) [duplicate]',
+    )
+    parser.add_argument(
+        '--keep-duplicates',
+        dest='keep_duplicates',
+        action='store_true',
+        help='only report duplicate pages instead of dropping them [duplicate]',
+    )
+    parser.add_argument(
+        '--tesseract-batch',
+        dest='tesseract_batch',
+        action='store_true',
+        help='recognize all pages of a document with one process [tesseract]',
+    )
+    parser.add_argument(
+        '--index',
+        dest='index',
+        action='store_true',
+        help='also save the recognized text and add it to the search index [tesseract]',
+    )
+    parser.add_argument(
+        '--index-file',
+        dest='index_file',
+        default=None,
+        help='search index to add the text to (default=~/.local/share/scanbro/index.sqlite) [tesseract]',
+    )
+    parser.add_argument(
+        '--pnm-profile',
+        dest='pnm_profile',
+        choices=PNMConvert.profiles.choices,
+        help='filter applied while converting PNM to PNG [pnm]',
+    )
     parser.add_argument(
         '--im-profile',
         dest='im_profile',
@@ -994,30 +3770,805 @@ if __name__ == "__main__":
         action='store_true',
         help='benchmark the suite of profiles [ghostscript]',
     )
+    parser.add_argument(
+        '--gs-benchmark-json',
+        dest='gs_benchmark_json',
+        default=None,
+        help='write the benchmark results to a JSON file [ghostscript]',
+    )
+    parser.add_argument(
+        '--gs-target-size',
+        dest='gs_target_size',
+        default=None,
+        help='reduce quality until the PDF is at most this size, such as 5M [ghostscript]',
+    )
+    parser.add_argument(
+        '--cache',
+        dest='cache',
+        action='store_true',
+        help='reuse stage output from previous runs with the same input',
+    )
+    parser.add_argument(
+        '--cache-dir',
+        dest='cache_dir',
+        default=None,
+        help='directory for cached stage output (default=~/.cache/scanbro/stages)',
+    )
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        default='2G',
+        help='maximum size of the stage cache (default=2G)',
+    )
     parser.add_argument(
         '-a', '--auto',
         dest='auto',
         action='store_true',
         help='enable recommended post-processing filters',
     )
+    return parser
 
-    # Parse program options:
-    args = parser.parse_args()
+
+def prepare_args(args):
+    """Apply implied options to args and check that they are consistent."""
     if args.auto:
         # Apply the currently recommended settings.
         # Specific options can be overriden, but certain filters will
         # be enabled and cannot be disabled if --auto is specified.
         args.filters.extend(['tesseract', 'ghostscript'])
-    if 'unpaper' in args.filters:
-        # We need to convert from PNM to PNG. The default options for
-        # ImageMagick should result in a lossless conversion.
+    if 'unpaper' in args.filters and (args.im_profile is not None or args.convert_quality is not None):
+        # ImageMagick options used to apply to the output of unpaper, so
+        # we keep that behavior. Any other conversions are planned.
         args.filters.append('imagemagick')
     if args.group_by != 0 and args.exclude is not None:
         raise Exception('cannot specify --group-by and --exclude simultaneously')
+    if args.group_by != 0 and 'blank' in args.filters:
+        raise Exception('cannot specify --group-by and the blank filter simultaneously')
+    if args.group_by != 0 and 'duplicate' in args.filters and not args.keep_duplicates:
+        raise Exception('cannot specify --group-by and the duplicate filter simultaneously')
+    if args.jobs is not None and args.jobs < 1:
+        raise Exception('--jobs requires a positive number')
+    if args.gs_benchmark and args.gs_target_size is not None:
+        raise Exception('cannot specify --gs-benchmark and --gs-target-size simultaneously')
+    if args.resume and args.clean >= 3:
+        raise Exception('cannot specify --resume and force scanning simultaneously')
+    if args.index and 'tesseract' not in args.filters:
+        raise Exception('--index requires the tesseract filter')
+    if args.from_files or args.from_dirs:
+        if args.interactive or args.stream or args.exclude is not None or args.group_by != 0:
+            raise Exception('cannot read from files with --interactive, --stream, --exclude or --group-by')
+        if len(args.filters) == 0:
+            raise Exception('reading from files requires at least one filter')
+
+
+def run(args, output, device=None, scanner=None, tracer=None, progress=None):
+    """
+    Create the scanner and pipeline described by args, and scan to output.
 
-    # Create scanner and pipeline. The order is not customizable.
-    scanner = make_scanner(args)
+    If device: it is held while the scanner is in use.
+
+    If scanner: it is used instead of the scanner described by args.
+
+    If tracer: commands are recorded to it instead of args.trace, and it
+       is left open for the caller.
+
+    If progress: pages are counted by it instead of args.progress, and it
+       is left open for the caller.
+    """
+    # Create scanner and pipeline. The order is not customizable, but
+    # the planner adds and removes conversions as required.
+    if scanner is None:
+        scanner = make_scanner(args)
     pipeline = [ FILTERS[f](scanner, args) for f in FILTERS if f in args.filters ]
+    pipeline = Planner([
+        lambda: PNMConvert(),
+        lambda: ImageMagick(None, None),
+    ]).plan(scanner, pipeline)
+    if args.cache:
+        cache = StageCache(args.cache_dir, parse_size(args.cache_size))
+        for p in pipeline:
+            p.cache = cache
+    if args.timeout is not None:
+        for p in pipeline:
+            p.timeout = args.timeout
+
+    own_tracer = tracer is None and args.trace is not None
+    if own_tracer:
+        tracer = Tracer(args.trace)
+    if tracer is not None:
+        for p in [scanner] + pipeline:
+            p.tracer = tracer
+    workdir = None
+    if args.workdir is not None:
+        workdir = Workdir(args.workdir, parse_size(args.workdir_size))
+    scheduler = None
+    if args.cores is not None or args.plan is not None:
+        scheduler = Scheduler(args.cores, parse_plan(args.plan))
+    manifest = None
+    if not args.dryrun and len(pipeline) > 0:
+        manifest = Manifest(with_suffix(output, 'scanbro.jsonl'), pipeline, args.resume)
+
+    stages = [scanner.binary] + [p.binary for p in pipeline]
+    own_progress = progress is None and args.progress
+    if own_progress:
+        progress = Progress(stages, document=output)
+    elif progress is not None:
+        progress.include(stages)
+    if progress is not None:
+        for p in [scanner] + pipeline:
+            p.progress = progress
+
+    # Do the real work :-D
+    destination = os.path.dirname(output)
+    try:
+        with progress if own_progress else contextlib.nullcontext():
+            output = scanbro(
+                scanner,
+                pipeline,
+                output,
+                clean=args.clean,
+                exclude=parse_exclude(args.exclude),
+                interactive=args.interactive,
+                dryrun=args.dryrun,
+                jobs=args.jobs,
+                stream=args.stream,
+                scheduler=scheduler,
+                workdir=workdir,
+                pipe=args.pipe,
+                device=device,
+                manifest=manifest,
+            )
+    except Exception:
+        if manifest is not None:
+            manifest.close()
+            Color.info(f'Progress is saved in {manifest.path}, continue with --resume')
+        raise
+    tesseract = next((p for p in pipeline if isinstance(p, Tesseract) and p.text), None)
+    if tesseract is not None and manifest is not None:
+        index_text(manifest, tesseract, output, args.clean, args.index_file)
+    if manifest is not None:
+        manifest.remove()
+    if workdir is not None:
+        # Nothing refers to the intermediate files once the manifest is
+        # removed, so these are kept next to the output as without workdir.
+        if args.clean == 0 and not args.dryrun:
+            workdir.move(destination)
+        workdir.cleanup()
+    if own_tracer:
+        tracer.summary()
+        tracer.close()
+    return output
+
+
+def index_text(manifest, tesseract, output_files, clean=0, path=None):
+    """
+    Write the text that tesseract recognized on the pages of each of
+    output_files to a text file next to it, and add the pages to the
+    SearchIndex at path. The manifest tells which pages every output file
+    was created from.
+
+    If clean > 0: the text files of tesseract itself are deleted.
+    """
+    stage = manifest.pipeline.index(tesseract)
+    text_files = []
+    def collect(file):
+        index, input_files = manifest.producer(file)
+        if index > stage:
+            return [page for f in input_files for page in collect(f)]
+        text_file = tesseract.text_file(file)
+        if not os.path.exists(text_file):
+            raise Exception(f'cannot index {file} without its text {text_file}')
+        text_files.append(text_file)
+        with open(text_file, errors='replace') as f:
+            pages = f.read().split('\f')
+        # Tesseract ends every page with a form feed.
+        return (pages + [''] * len(input_files))[:len(input_files)]
+
+    with SearchIndex(path) as index:
+        for file in output_files:
+            pages = collect(manifest.source(file))
+            text_file = with_suffix(file, 'txt')
+            Color.debug(f'write {text_file}')
+            with open(text_file, 'w') as f:
+                f.writelines(page + '\f' for page in pages)
+            index.update(file, pages)
+            Color.info(f'Indexed {len(pages)} pages of {file} in {index.path}')
+    if clean > 0:
+        for file in text_files:
+            remove_file(file)
+
+
+def group_files(files, pattern):
+    """
+    Group files into documents by their directory and the groups doc and
+    page of pattern, which is matched against the filenames without
+    extension. Files that do not match are documents of their own.
+
+    Return a dict of (directory, document name) to the files ordered by
+    page. Two files for the same page of a document are an error.
+    """
+    regex = re.compile(pattern)
+    documents = {}
+    for file in files:
+        path = pathlib.PurePath(file)
+        match = regex.match(path.stem)
+        if match is None:
+            doc, page = path.stem, 0
+        else:
+            doc, page = match.group('doc'), int(match.group('page'))
+        pages = documents.setdefault((str(path.parent), doc), {})
+        if page in pages:
+            raise Exception(f'page {page} of document {doc} is both {pages[page]} and {file}')
+        pages[page] = file
+    return { key: [pages[p] for p in sorted(pages)] for key, pages in sorted(documents.items()) }
+
+
+def list_images(directory):
+    return sorted(
+        e.path for e in os.scandir(directory)
+        if e.is_file() and FileSource.filetype_of(e.name) is not None
+    )
+
+
+def ingest(args, destination):
+    """
+    Run the existing image files given by args through the pipeline, with
+    one output per document in destination, and return the output files.
+
+    Up to args.jobs documents, or as many as there are cores, are processed
+    at the same time, each of them one page at a time. A document that
+    fails is reported and skipped. Input files are never deleted.
+
+    Documents from different directories are placed in the same
+    directories relative to destination.
+    """
+    files = list(args.from_files)
+    for directory in args.from_dirs:
+        files.extend(list_images(directory))
+    documents = group_files(files, args.doc_pattern)
+    if len(documents) == 0:
+        raise Exception('expected image files to read, found nothing')
+    Color.info(f'Read {len(files)} files as {len(documents)} documents')
+    root = os.path.commonpath([os.path.abspath(d) for d, _ in documents])
+    names = {
+        (d, doc): os.path.normpath(os.path.join(os.path.relpath(os.path.abspath(d), root), doc))
+        for d, doc in documents
+    }
+    for name in names.values():
+        os.makedirs(os.path.join(destination, os.path.dirname(name)), exist_ok=True)
+
+    doc_args = argparse.Namespace(**vars(args))
+    doc_args.jobs = 1
+    doc_args.clean = min(args.clean, 1)
+    tracer = None
+    if args.trace is not None:
+        tracer = Tracer(args.trace)
+    # All documents are counted together, to report the overall rate.
+    progress = None
+    if args.progress:
+        progress = Progress([FileSource.binary])
+
+    failed = []
+    def process_document(item):
+        key, pages = item
+        name = names[key]
+        # Output names get their suffix replaced, which must not cut off
+        # the part of document names after a dot.
+        output = os.path.join(destination, name) + '.pdf'
+        try:
+            return run(doc_args, output, scanner=FileSource(pages), tracer=tracer, progress=progress)
+        except Exception as e:
+            Color.error(f'Document {name} failed: {str(e) or type(e).__name__}')
+            failed.append(name)
+            return []
+
+    jobs = args.jobs if args.jobs is not None else os.cpu_count() or 1
+    start = time.monotonic()
+    with progress or contextlib.nullcontext():
+        outputs = run_parallel(process_document, list(documents.items()), jobs)
+    elapsed = time.monotonic() - start
+    done = len(documents) - len(failed)
+    Color.info(
+        f'Processed {done} documents ({len(files)} pages) in {elapsed:.1f}s, '
+        f'{done / max(elapsed, 1e-3) * 60:.1f} documents/min'
+    )
+    if tracer is not None:
+        tracer.summary()
+        tracer.close()
+    if len(failed) > 0:
+        raise Exception(f'{len(failed)} documents failed: {", ".join(failed)}')
+    return [f for output in outputs for f in output]
+
+
+class DevicePool:
+    """
+    Hand out idle scanner devices from a fixed set, so that several jobs
+    scan at the same time, each on a device of its own. A pool of the
+    device None serializes all jobs on the scanner's own device.
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self.idle = list(devices)
+        self.condition = threading.Condition()
+
+    def __contains__(self, device):
+        return self.devices == [None] or device in self.devices
+
+    @contextlib.contextmanager
+    def hold(self, device=None):
+        """Wait until device, or any device if None, is idle and yield it."""
+        if self.devices == [None]:
+            device = None
+        with self.condition:
+            if device is None:
+                self.condition.wait_for(lambda: len(self.idle) > 0)
+                device = self.idle[0]
+            else:
+                self.condition.wait_for(lambda: device in self.idle)
+            self.idle.remove(device)
+        try:
+            yield device
+        finally:
+            with self.condition:
+                self.idle.append(device)
+                self.condition.notify_all()
+
+
+def default_socket():
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir()), 'scanbro.sock')
+
+
+class Daemon:
+    """
+    Serve scan jobs over a Unix socket, so that several users can share one
+    scanner without colliding on it.
+
+    A job is given by the same arguments as the command line. Every job
+    scans on an idle device of the pool, or waits for one, while up to
+    workers jobs are processed at the same time. All jobs share cores
+    slots for running commands, which are as many as there are cores if
+    the pool has several devices, and unlimited otherwise. Requests and
+    responses are single lines of JSON::
+
+        {"command": "submit", "argv": [...], "cwd": "..."} -> {"id": 1}
+        {"command": "status"}                             -> {"jobs": [...]}
+    """
+
+    def __init__(self, path, workers=None, devices=None, cores=None):
+        self.path = path
+        self.pool = DevicePool(devices or [None])
+        if cores is None and len(self.pool.devices) > 1:
+            # Jobs on different devices run at the same time, each with
+            # its own jobs, which must not add up beyond the cores.
+            cores = os.cpu_count() or 1
+        if cores is not None:
+            Processor.slots = threading.BoundedSemaphore(cores)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.next_id = 1
+
+    def submit(self, argv, cwd):
+        args = make_parser().parse_args(argv)
+        prepare_args(args)
+        if args.output is None:
+            raise Exception('jobs require an output file')
+        if args.interactive or args.verify:
+            raise Exception('jobs cannot be interactive')
+        if args.from_files or args.from_dirs:
+            raise Exception('jobs cannot read from files')
+        if args.device is not None and args.device not in self.pool:
+            raise Exception(f'device {args.device} is not in the pool')
+        # The daemon does not share the client's working directory.
+        for key in ('output', 'trace', 'workdir', 'cache_dir', 'index_file', 'gs_benchmark_json'):
+            if getattr(args, key) is not None:
+                setattr(args, key, os.path.join(cwd, getattr(args, key)))
+        output = args.output
+        with self.lock:
+            job = {
+                'id': self.next_id,
+                'argv': argv,
+                'output': output,
+                'state': 'queued',
+                'device': None,
+                'files': [],
+                'error': None,
+                'submitted': time.time(),
+                'finished': None,
+            }
+            self.jobs[job['id']] = job
+            self.next_id += 1
+        Color.info(f"Queue job {job['id']}: {' '.join(argv)}")
+        self.executor.submit(self.run_job, job, args, output)
+        return job['id']
+
+    @contextlib.contextmanager
+    def scanning(self, job, device=None):
+        job['state'] = 'waiting'
+        with self.pool.hold(device) as held:
+            job['state'] = 'scanning'
+            job['device'] = held
+            yield held
+        job['state'] = 'processing'
+
+    def run_job(self, job, args, output):
+        try:
+            job['files'] = run(args, output, self.scanning(job, args.device))
+            job['state'] = 'done'
+        except Exception as e:
+            job['state'] = 'failed'
+            job['error'] = str(e) or type(e).__name__
+            Color.error(f"Job {job['id']} failed: {job['error']}")
+        job['finished'] = time.time()
+
+    def handle(self, request):
+        if request.get('command') == 'submit':
+            return {'id': self.submit(request['argv'], request['cwd'])}
+        elif request.get('command') == 'status':
+            with self.lock:
+                return {'jobs': [dict(job) for job in self.jobs.values()]}
+        raise Exception(f"unknown command {request.get('command')}")
+
+    def serve(self):
+        daemon = self
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        response = daemon.handle(json.loads(line))
+                    except (Exception, SystemExit) as e:
+                        response = {'error': str(e) or type(e).__name__}
+                    self.wfile.write((json.dumps(response) + '\n').encode())
+
+        if os.path.exists(self.path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(self.path)
+                except ConnectionRefusedError:
+                    # Left behind by a daemon that did not shut down cleanly.
+                    os.remove(self.path)
+                else:
+                    raise Exception(f'another daemon is listening on {self.path}')
+        with socketserver.ThreadingUnixStreamServer(self.path, Handler) as server:
+            Color.info(f'Listening on {self.path}')
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(self.path)
+                self.executor.shutdown(cancel_futures=True)
+
+
+def request(path, message):
+    """Send a request to the daemon listening on path and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall((json.dumps(message) + '\n').encode())
+        response = json.loads(sock.makefile().readline())
+    if 'error' in response:
+        raise Exception(response['error'])
+    return response
+
+
+def daemon_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='scanbro daemon',
+        description='Serve scan jobs over a Unix socket.',
+    )
+    parser.add_argument(
+        '-S', '--socket',
+        dest='socket',
+        default=default_socket(),
+        help='path of the socket to listen on',
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        dest='workers',
+        type=int,
+        default=None,
+        help='number of jobs to process at the same time',
+    )
+    parser.add_argument(
+        '-D', '--device',
+        dest='devices',
+        default=[],
+        action='append',
+        help='add a scanner device to the pool, to scan on several devices at the same time',
+    )
+    parser.add_argument(
+        '--cores',
+        dest='cores',
+        type=int,
+        default=None,
+        help='run at most N commands at the same time, across all jobs (default=all cores with several devices)',
+    )
+    args = parser.parse_args(argv)
+    try:
+        Daemon(args.socket, args.workers, args.devices, args.cores).serve()
+    except KeyboardInterrupt:
+        pass
+
+
+def submit_main(argv):
+    """Submit a job: scanbro submit [-S SOCKET] ARGS..."""
+    path = default_socket()
+    if len(argv) >= 2 and argv[0] in ('-S', '--socket'):
+        path, argv = argv[1], argv[2:]
+    # Check the arguments here, so that errors are shown to the user.
+    prepare_args(make_parser().parse_args(argv))
+    response = request(path, {'command': 'submit', 'argv': argv, 'cwd': os.getcwd()})
+    Color.info(f"Submitted job {response['id']}")
+
+
+def status_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='scanbro status',
+        description='Show the status of jobs in the daemon.',
+    )
+    parser.add_argument(
+        '-S', '--socket',
+        dest='socket',
+        default=default_socket(),
+        help='path of the socket of the daemon',
+    )
+    args = parser.parse_args(argv)
+    response = request(args.socket, {'command': 'status'})
+    for job in response['jobs']:
+        line = f"{job['id']:>4} {job['state']:<10} {job['output']}"
+        if job.get('device') is not None:
+            line += f" [{job['device']}]"
+        if job['error'] is not None:
+            line += f" ({job['error']})"
+        Color.print(line, prefix='   ')
+
+
+def run_benchmark(filters, pages=5, resolution='150', jobs=1):
+    """
+    Run a fixed corpus of generated documents in every mode through the
+    pipeline given by filters, once for every Ghostscript profile, and
+    return the measurements of each case.
+    """
+    results = []
+    profiles = list(Ghostscript.profiles.choices) if 'ghostscript' in filters else [None]
+    with tempfile.TemporaryDirectory(prefix='scanbro-benchmark-') as tmpdir:
+        for mode in ['bw', 'gray', 'color']:
+            scanner = SimulatedScanner({'papersize': 'a4', 'mode': mode, 'resolution': resolution, 'source': 'adf'})
+            scanner.device = f'pages={pages},seed=1'
+            prototype = os.path.join(tmpdir, f'{mode}.%d.{scanner.filetype}')
+            scanner.process(None, prototype)
+            files = scanner.output(prototype)
+            for profile in profiles:
+                case = mode if profile is None else f'{mode}/{profile}'
+                argv = ['-c', '-j', str(jobs)] + [f'--filter={f}' for f in filters]
+                if profile is not None:
+                    argv.append(f'--gs-profile={profile}')
+                args = make_parser().parse_args(argv)
+                prepare_args(args)
+                directory = os.path.join(tmpdir, case.replace('/', '-'))
+                os.makedirs(directory)
+                tracer = Tracer(os.path.join(directory, 'trace.jsonl'))
+                start = time.monotonic()
+                output = run(args, os.path.join(directory, 'out'), scanner=FileSource(files), tracer=tracer)
+                wall = time.monotonic() - start
+                tracer.close()
+                results.append({
+                    'case': case,
+                    'pages': len(files),
+                    'wall': wall,
+                    'pages_per_sec': len(files) / wall,
+                    'cpu_per_page': sum(t['cpu'] for t in tracer.stages.values()) / len(files),
+                    'maxrss': max([t['maxrss'] for t in tracer.stages.values()] + [0]),
+                    'bytes_per_page': sum(os.path.getsize(f) for f in output) / len(files),
+                })
+    return results
+
+
+def compare_benchmark(results, baseline, threshold):
+    """
+    Print the results next to their change from the baseline, and return
+    the regressions that are larger than threshold, as a fraction.
+    """
+    # Metrics where larger is better have sign -1.
+    metrics = {
+        'pages_per_sec': -1,
+        'cpu_per_page': 1,
+        'maxrss': 1,
+        'bytes_per_page': 1,
+    }
+    previous = {r['case']: r for r in baseline}
+    regressions = []
+    Color.print(
+        f"{'case':<16} {'pages/s':>14} {'cpu/page [s]':>16} {'max rss':>16} {'bytes/page':>16}",
+        prefix='   ',
+    )
+    for r in results:
+        columns = {
+            'pages_per_sec': f"{r['pages_per_sec']:.2f}",
+            'cpu_per_page': f"{r['cpu_per_page']:.3f}",
+            'maxrss': format_size(r['maxrss']),
+            'bytes_per_page': format_size(int(r['bytes_per_page'])),
+        }
+        old = previous.get(r['case'])
+        if old is not None:
+            for metric, sign in metrics.items():
+                if old[metric] == 0:
+                    continue
+                change = (r[metric] - old[metric]) / old[metric]
+                columns[metric] += f' {change:+4.0%}'
+                if sign * change > threshold:
+                    columns[metric] += '!'
+                    regressions.append((r['case'], metric, change))
+        Color.print(
+            f"{r['case']:<16} {columns['pages_per_sec']:>14} {columns['cpu_per_page']:>16} "
+            f"{columns['maxrss']:>16} {columns['bytes_per_page']:>16}",
+            prefix='   ',
+        )
+    return regressions
+
+
+def benchmark_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='scanbro benchmark',
+        description='Benchmark standard pipelines on generated documents.',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        dest='output',
+        default='scanbro-benchmark.json',
+        help='write the results to this JSON file (default=scanbro-benchmark.json)',
+    )
+    parser.add_argument(
+        '-B', '--baseline',
+        dest='baseline',
+        default=None,
+        help='compare the results with a results file from an earlier run',
+    )
+    parser.add_argument(
+        '-t', '--threshold',
+        dest='threshold',
+        type=float,
+        default=0.1,
+        help='report changes for the worse above this fraction as regressions (default=0.1)',
+    )
+    parser.add_argument(
+        '--pages',
+        dest='pages',
+        type=int,
+        default=5,
+        help='number of pages of each generated document (default=5)',
+    )
+    parser.add_argument(
+        '-r', '--resolution',
+        dest='resolution',
+        default='150',
+        choices=SimulatedScanner.resolutions.choices,
+        help='resolution of the generated documents, in DPI (default=150)',
+    )
+    parser.add_argument(
+        '-f', '--filter',
+        dest='filters',
+        default=[],
+        action='append',
+        choices=FILTERS,
+        help='filters of the pipeline (default=tesseract and ghostscript)',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        default=1,
+        help='process up to N pages in parallel (default=1)',
+    )
+    args = parser.parse_args(argv)
+    filters = args.filters or ['tesseract', 'ghostscript']
+
+    results = run_benchmark(filters, args.pages, args.resolution, args.jobs)
+    baseline = []
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+    Color.info(f"Benchmark of {' + '.join(filters)}")
+    regressions = compare_benchmark(results, baseline, args.threshold)
+    Color.debug(f'write {args.output}')
+    with open(args.output, 'w') as file:
+        json.dump({
+            'time': time.time(),
+            'filters': filters,
+            'pages': args.pages,
+            'resolution': args.resolution,
+            'jobs': args.jobs,
+            'results': results,
+        }, file, indent=2)
+    if len(regressions) > 0:
+        for case, metric, change in regressions:
+            Color.error(f'Regression in {case}: {metric} changed by {change:+.0%}')
+        sys.exit(1)
+
+
+def devices_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='scanbro devices',
+        description='Show the scanners found by scanimage and their options.',
+    )
+    parser.add_argument(
+        '-d', '--device',
+        dest='device',
+        default=None,
+        help='show the options of this device only',
+    )
+    parser.add_argument(
+        '--refresh',
+        dest='refresh',
+        action='store_true',
+        help='discover scanners and their options again instead of using the cache',
+    )
+    args = parser.parse_args(argv)
+    cache = DeviceCache()
+    devices = [args.device] if args.device is not None else [d['device'] for d in cache.devices(args.refresh)]
+    for device in devices:
+        backend = discover_backend(device, args.refresh)
+        Color.info(f'{device}: {backend.name}')
+        for label, option in [('papersizes', backend.papersizes), ('modes', backend.modes),
+                              ('resolutions', backend.resolutions), ('sources', backend.sources)]:
+            Color.print(f"{label:<12} {', '.join(option.choices)} (default={option.default})", prefix='   ')
+
+
+def search_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='scanbro search',
+        description='Search the text of the documents indexed with --index.',
+    )
+    parser.add_argument(
+        'query',
+        nargs='+',
+        help='words to search for, in the SQLite FTS5 query syntax',
+    )
+    parser.add_argument(
+        '-i', '--index-file',
+        dest='index_file',
+        default=None,
+        help='search index to use (default=~/.local/share/scanbro/index.sqlite)',
+    )
+    parser.add_argument(
+        '-n', '--limit',
+        dest='limit',
+        type=int,
+        default=20,
+        help='maximum number of pages to show (default=20)',
+    )
+    args = parser.parse_args(argv)
+    with SearchIndex(args.index_file) as index:
+        matches = index.search(' '.join(args.query), args.limit)
+    for path, page, snippet in matches:
+        Color.print(f"{path}:{page}: {' '.join(snippet.split())}", prefix='')
+    if len(matches) == 0:
+        sys.exit(1)
+
+
+COMMANDS = {
+    'daemon': daemon_main,
+    'submit': submit_main,
+    'status': status_main,
+    'benchmark': benchmark_main,
+    'devices': devices_main,
+    'search': search_main,
+}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) > 0 and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    args = make_parser().parse_args(argv)
+    prepare_args(args)
+
+    # Reading existing files is non-interactive, and writes one output per
+    # document to the output directory.
+    if args.from_files or args.from_dirs:
+        ingest(args, args.output or '.')
+        return
 
     # If the user did not specify a filename, we put the output files in
     # a temporary directory and prompt the user to specify the name afterwards.
@@ -1036,16 +4587,7 @@ if __name__ == "__main__":
     if tmpdir is not None:
         Color.info(f'Using temporary directory: {tmpdir}')
 
-    # Do the real work :-D
-    output = scanbro(
-        scanner,
-        pipeline,
-        output,
-        clean=args.clean,
-        exclude=parse_exclude(args.exclude),
-        interactive=args.interactive,
-        dryrun=args.dryrun,
-    )
+    output = run(args, output)
 
     # Quit early if we are in dryrun mode because the next section requires
     # us to actually have created files.
@@ -1068,3 +4610,7 @@ if __name__ == "__main__":
             process = show_file(file)
             Color.input('Press <Enter> for next or <Ctrl+C> to quit', suffix='.')
             process.terminate()
+
+
+if __name__ == "__main__":
+    main()
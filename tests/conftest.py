@@ -0,0 +1,78 @@
+"""
+Shared fixtures of the offline tests, which use the simulated scanner and
+FileSource instead of a scanner, and fake tesseract and gs executables
+that only record which pages they were given.
+"""
+
+import os
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import scanbro
+
+
+# Writes the names of its input files as the "PDF", and as the text if
+# requested, after a delay for the first page so that it finishes last, and
+# fails for $FAIL_PAGE.
+FAKE_TESSERACT = """#!/bin/sh
+in="$1"; out="$2"
+case "$in" in *.1.*) [ -n "$SLOW_PAGE" ] && exec sleep "$SLOW_PAGE"; sleep 0.2;; esac
+if [ -n "$FAIL_PAGE" ]; then
+    case "$in" in *."$FAIL_PAGE".*) echo "cannot read $in" >&2; exit 1;; esac
+fi
+case "$in" in
+    *.list) while read f; do basename "$f"; done < "$in";;
+    *) basename "$in";;
+esac > "$out.pdf"
+case "$*" in
+    *txt) while read name; do printf 'text of %s\\f' "$name"; done < "$out.pdf" > "$out.txt";;
+esac
+"""
+
+# Concatenates its input files to the output file.
+FAKE_GS = """#!/bin/sh
+files=
+for a in "$@"; do
+    case "$a" in
+        -sOutputFile=*) out="${a#-sOutputFile=}";;
+        -*) ;;
+        *) files="$files $a";;
+    esac
+done
+cat $files > "$out"
+"""
+
+
+@pytest.fixture
+def tools(tmp_path, monkeypatch):
+    bin = tmp_path / 'bin'
+    bin.mkdir()
+    for name, script in [('tesseract', FAKE_TESSERACT), ('gs', FAKE_GS)]:
+        (bin / name).write_text(script)
+        (bin / name).chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.delenv('SLOW_PAGE', raising=False)
+    monkeypatch.delenv('FAIL_PAGE', raising=False)
+    scanbro.which.cache_clear()
+    yield bin
+    scanbro.which.cache_clear()
+
+
+def parse(argv):
+    args = scanbro.make_parser().parse_args(argv)
+    scanbro.prepare_args(args)
+    return args
+
+
+def pages(pdf):
+    return pathlib.Path(pdf).read_text().split()
+
+
+def write_pages(*files, magic=b'P5', width=8, height=8):
+    for file in files:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        with scanbro.PNMImage.create(str(file), magic, width, height):
+            pass
@@ -0,0 +1,38 @@
+import pytest
+
+import scanbro
+
+
+def bitmap(path, width, height, marks):
+    with scanbro.PNMImage.create(str(path), b'P4', width, height) as image:
+        for x, y in marks:
+            image[x, y] = 1
+    return str(path)
+
+
+@pytest.mark.parametrize('x, counted', [(1, False), (2, True), (9, True), (16, True), (17, True), (18, False)])
+def test_bitmap_margins(tmp_path, x, counted):
+    # A margin of 2 pixels leaves columns 2 to 17, which end within a byte.
+    blank = scanbro.BlankFilter(margin=0.1)
+    file = bitmap(tmp_path / 'page.pbm', 20, 20, [(x, 10)])
+    assert blank.coverage(file) == (1 / (16 * 16) if counted else 0.0)
+
+
+def test_bitmap_unaligned_width(tmp_path):
+    blank = scanbro.BlankFilter(margin=0.0)
+    file = bitmap(tmp_path / 'page.pbm', 13, 2, [(12, 0), (12, 1)])
+    assert blank.coverage(file) == 2 / 26
+
+
+def test_graymap(tmp_path):
+    path = str(tmp_path / 'page.pgm')
+    with scanbro.PNMImage.create(path, b'P5', 10, 10) as image:
+        for y in range(10):
+            image.set_row(y, bytes([255] * 10))
+        image[1, 5] = 0
+        image[5, 5] = 100
+        image[6, 5] = 200
+    blank = scanbro.BlankFilter(threshold=0.01, margin=0.1)
+    assert blank.coverage(path) == 2 / 64
+    assert blank.keep(path)
+    assert not scanbro.BlankFilter(threshold=0.04, margin=0.1).keep(path)
@@ -0,0 +1,52 @@
+import os
+
+import scanbro
+
+
+def write(path, data):
+    with open(path, 'wb') as file:
+        file.write(data)
+    return str(path)
+
+
+def test_key_ignores_filenames(tmp_path):
+    a = write(tmp_path / 'a.pnm', b'page')
+    b = write(tmp_path / 'b.pnm', b'page')
+    key = scanbro.StageCache.key
+    cmd = lambda i, o: ['tesseract', i, o[:-4], '-l', 'deu', 'pdf']
+    assert key(cmd(a, 'x.pdf'), [a], 'x.pdf') == key(cmd(b, 'y.pdf'), [b], 'y.pdf')
+
+
+def test_key_depends_on_contents_and_arguments(tmp_path):
+    a = write(tmp_path / 'a.pnm', b'page')
+    b = write(tmp_path / 'b.pnm', b'other page')
+    key = scanbro.StageCache.key
+    assert key(['tesseract', a, 'x', '-l', 'deu'], [a], 'x.pdf') != key(['tesseract', b, 'x', '-l', 'deu'], [b], 'x.pdf')
+    assert key(['tesseract', a, 'x', '-l', 'deu'], [a], 'x.pdf') != key(['tesseract', a, 'x', '-l', 'eng'], [a], 'x.pdf')
+    # Input files are not concatenated without a separator.
+    c = write(tmp_path / 'c.pnm', b'pa')
+    d = write(tmp_path / 'd.pnm', b'ge')
+    assert key(['gs', '{in}'], [a], 'x.pdf') != key(['gs', '{in}', '{in}'], [c, d], 'x.pdf')
+
+
+def test_lookup_and_store(tmp_path):
+    cache = scanbro.StageCache(str(tmp_path / 'cache'), 1 << 20)
+    output = write(tmp_path / 'out.pdf', b'result')
+    assert not cache.lookup('0123', str(tmp_path / 'copy.pdf'))
+    cache.store('0123', output)
+    assert cache.lookup('0123', str(tmp_path / 'copy.pdf'))
+    with open(tmp_path / 'copy.pdf', 'rb') as file:
+        assert file.read() == b'result'
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = scanbro.StageCache(str(tmp_path / 'cache'), 250)
+    for i, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.store(key, write(tmp_path / 'out', bytes(100)))
+        os.utime(cache.path(key), (i, i))
+    assert not os.path.exists(cache.path('aa01'))
+    cache.lookup('bb02', str(tmp_path / 'copy'))
+    cache.store('dd04', write(tmp_path / 'out', bytes(100)))
+    assert os.path.exists(cache.path('bb02'))
+    assert not os.path.exists(cache.path('cc03'))
+    assert cache.size <= 250
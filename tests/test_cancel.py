@@ -0,0 +1,20 @@
+import time
+
+import pytest
+
+import scanbro
+from conftest import parse
+
+
+def test_failing_page_aborts_run(tools, tmp_path, monkeypatch):
+    monkeypatch.setenv('SLOW_PAGE', '30')
+    monkeypatch.setenv('FAIL_PAGE', '3')
+    output = str(tmp_path / 'scan.pdf')
+    args = parse(['-b', 'simulated', '-d', 'pages=4', '-f', 'tesseract', '-f', 'ghostscript', '-j', '4'])
+    start = time.monotonic()
+    with pytest.raises(Exception):
+        scanbro.run(args, output)
+    # The slow first page is killed instead of waited for.
+    assert time.monotonic() - start < 10
+    assert not (tmp_path / 'scan.tesseract.gs.pdf').exists()
+    assert (tmp_path / 'scan.scanbro.jsonl').exists()
@@ -0,0 +1,49 @@
+import pytest
+
+import scanbro
+
+
+def write_page(path, magic, width, height, dark):
+    """Write a page whose pixels are black where dark(x, y) is True."""
+    with scanbro.PNMImage.create(str(path), magic, width, height) as image:
+        for y in range(height):
+            for x in range(width):
+                if magic == b'P4':
+                    image[x, y] = int(dark(x, y))
+                else:
+                    image[x, y] = 0 if dark(x, y) else 255
+    return str(path)
+
+
+@pytest.fixture
+def duplicates(tmp_path):
+    return lambda **kwargs: scanbro.DuplicateFilter(hashes=scanbro.HashCache(str(tmp_path / 'hashes.sqlite')), **kwargs)
+
+
+def test_fingerprint(tmp_path, duplicates):
+    left = lambda x, y: x < 9
+    a = write_page(tmp_path / 'a.pgm', b'P5', 18, 16, left)
+    b = write_page(tmp_path / 'b.pgm', b'P5', 18, 16, left)
+    c = write_page(tmp_path / 'c.pgm', b'P5', 18, 16, lambda x, y: x >= 9)
+    d = duplicates()
+    assert d.fingerprint(a) == d.fingerprint(b) != 0
+    assert d.fingerprint(a) != d.fingerprint(c)
+
+
+@pytest.mark.parametrize('width', [18, 45, 100])
+def test_fingerprint_bitmap(tmp_path, duplicates, width):
+    # Bitmaps narrower than a byte per cell are hashed like graymaps.
+    dark = lambda x, y: (x * 3 // width + y) % 2 == 0
+    d = duplicates()
+    gray = write_page(tmp_path / 'page.pgm', b'P5', width, 16, dark)
+    bitmap = write_page(tmp_path / 'page.pbm', b'P4', width, 16, dark)
+    assert d.fingerprint(bitmap) == d.fingerprint(gray)
+
+
+@pytest.mark.parametrize('keep_duplicates', [False, True])
+def test_keep(tmp_path, duplicates, keep_duplicates):
+    first = write_page(tmp_path / 'scan.1.pgm', b'P5', 18, 16, lambda x, y: x < 9)
+    again = write_page(tmp_path / 'scan.2.pgm', b'P5', 18, 16, lambda x, y: x < 9)
+    other = write_page(tmp_path / 'scan.3.pgm', b'P5', 18, 16, lambda x, y: y < 8)
+    d = duplicates(threshold=0, keep_duplicates=keep_duplicates)
+    assert [d.keep(f) for f in [first, again, other]] == [True, keep_duplicates, True]
@@ -0,0 +1,54 @@
+import pytest
+
+import scanbro
+from conftest import parse
+
+
+def test_update_and_search(tmp_path):
+    with scanbro.SearchIndex(str(tmp_path / 'index.sqlite')) as index:
+        index.update('a.pdf', ['invoice for the printer', 'terms'])
+        index.update('b.pdf', ['letter about the printer'])
+        assert sorted((r[0][-5:], r[1]) for r in index.search('printer')) == [('a.pdf', 1), ('b.pdf', 1)]
+        # Updating a document replaces all of its pages.
+        index.update('a.pdf', ['terms', 'receipt'])
+        assert index.search('printer')[0][0].endswith('b.pdf')
+        assert [(r[0][-5:], r[1]) for r in index.search('receipt')] == [('a.pdf', 2)]
+        # Invalid query syntax is searched for literally.
+        assert index.search('"receipt') != []
+
+
+def test_index_after_run(tools, tmp_path):
+    output = str(tmp_path / 'scan.pdf')
+    index_file = str(tmp_path / 'index.sqlite')
+    argv = ['-b', 'simulated', '-d', 'pages=2', '-f', 'tesseract', '-f', 'ghostscript', '--index', '--index-file', index_file]
+    files = scanbro.run(parse(argv), output)
+    with open(scanbro.with_suffix(files[0], 'txt')) as file:
+        assert file.read() == 'text of scan.1.pnm\ftext of scan.2.pnm\f'
+    with scanbro.SearchIndex(index_file) as index:
+        assert [r[1] for r in index.search('"scan.2.pnm"')] == [2]
+
+
+def test_resume_without_text(tools, tmp_path, monkeypatch):
+    output = str(tmp_path / 'scan.pdf')
+    argv = ['-b', 'simulated', '-d', 'pages=3', '-f', 'tesseract', '-f', 'ghostscript']
+    monkeypatch.setenv('FAIL_PAGE', '3')
+    with pytest.raises(Exception):
+        scanbro.run(parse(argv), output)
+    monkeypatch.delenv('FAIL_PAGE')
+    argv += ['--index', '--index-file', str(tmp_path / 'index.sqlite'), '--resume']
+    with pytest.raises(Exception, match='different arguments for tesseract'):
+        scanbro.run(parse(argv), output)
+
+
+def test_resume_redoes_missing_text(tools, tmp_path):
+    output = str(tmp_path / 'scan.pdf')
+    argv = ['-b', 'simulated', '-d', 'pages=2', '-f', 'tesseract', '-f', 'ghostscript', '--index']
+    # The run completes, but the index cannot be written.
+    with pytest.raises(Exception):
+        scanbro.run(parse(argv + ['--index-file', str(tmp_path)]), output)
+    (tmp_path / 'scan.2.tesseract.txt').unlink()
+
+    index_file = str(tmp_path / 'index.sqlite')
+    scanbro.run(parse(argv + ['--index-file', index_file, '--resume']), output)
+    with scanbro.SearchIndex(index_file) as index:
+        assert [r[1] for r in index.search('"scan.2.pnm"')] == [2]
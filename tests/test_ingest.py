@@ -0,0 +1,43 @@
+import pytest
+
+import scanbro
+from conftest import pages, write_pages
+
+
+def test_group_files():
+    documents = scanbro.group_files(
+        ['a/x.10.pnm', 'a/x.2.pnm', 'a/y.pnm', 'b/x.1.pnm'],
+        r'(?P<doc>.+)\.(?P<page>\d+)$',
+    )
+    assert documents == {
+        ('a', 'x'): ['a/x.2.pnm', 'a/x.10.pnm'],
+        ('a', 'y'): ['a/y.pnm'],
+        ('b', 'x'): ['b/x.1.pnm'],
+    }
+    with pytest.raises(Exception, match='page 1 of document x'):
+        scanbro.group_files(['a/x.1.pnm', 'a/x.01.pnm'], r'(?P<doc>.+)\.(?P<page>\d+)$')
+
+
+def test_ingest_groups_documents(tools, tmp_path):
+    source = tmp_path / 'archive'
+    write_pages(
+        source / 'dA' / 'report.2020.1.pgm',
+        source / 'dA' / 'report.2020.2.pgm',
+        source / 'dA' / 'letter.10.pgm',
+        source / 'dA' / 'letter.9.pgm',
+        source / 'dB' / 'letter.1.pgm',
+    )
+    destination = tmp_path / 'out'
+    scanbro.main([
+        '--from-dir', str(source / 'dA'),
+        '--from-dir', str(source / 'dB'),
+        '-f', 'tesseract', '-f', 'ghostscript', '-c',
+        str(destination),
+    ])
+    assert sorted(str(p.relative_to(destination)) for p in destination.rglob('*.pdf')) == [
+        'dA/letter.pdf', 'dA/report.2020.pdf', 'dB/letter.pdf',
+    ]
+    assert [name.rsplit('.', 2)[-2] for name in pages(destination / 'dA' / 'letter.pdf')] == ['9', '10']
+    assert len(pages(destination / 'dA' / 'report.2020.pdf')) == 2
+    # The input files are never modified.
+    assert len(list(source.rglob('*'))) == 7
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import scanbro
+from conftest import pages, parse
+
+
+def test_resume_reuses_steps(tools, tmp_path, monkeypatch):
+    output = str(tmp_path / 'scan.pdf')
+    argv = ['-b', 'simulated', '-d', 'pages=4', '-f', 'tesseract', '-f', 'ghostscript']
+    monkeypatch.setenv('FAIL_PAGE', '3')
+    with pytest.raises(Exception):
+        scanbro.run(parse(argv), output)
+    done = tmp_path / 'scan.2.tesseract.pdf'
+    mtime = done.stat().st_mtime_ns
+
+    monkeypatch.delenv('FAIL_PAGE')
+    files = scanbro.run(parse(argv + ['--resume']), output)
+    assert done.stat().st_mtime_ns == mtime
+    assert [name.split('.')[1] for name in pages(files[0])] == ['1', '2', '3', '4']
+    assert not (tmp_path / 'scan.scanbro.jsonl').exists()
+
+
+def test_resume_requires_same_arguments(tools, tmp_path):
+    path = str(tmp_path / 'scan.scanbro.jsonl')
+    scanbro.Manifest(path, [scanbro.Tesseract('deu')]).close()
+    scanbro.Manifest(path, [scanbro.Tesseract('deu')], resume=True).close()
+    with pytest.raises(Exception, match='different arguments for tesseract'):
+        scanbro.Manifest(path, [scanbro.Tesseract('eng')], resume=True)
+    with pytest.raises(Exception, match='different arguments for tesseract'):
+        scanbro.Manifest(path, [scanbro.Tesseract('deu', text=True)], resume=True)
+    with pytest.raises(Exception, match='different pipeline'):
+        scanbro.Manifest(path, [scanbro.Ghostscript()], resume=True)
+
+
+def test_resume_ignores_partial_step(tools, tmp_path):
+    path = str(tmp_path / 'scan.scanbro.jsonl')
+    input_file, output_file = str(tmp_path / 'scan.1.pnm'), str(tmp_path / 'scan.1.tesseract.pdf')
+    open(output_file, 'w').close()
+    tesseract = scanbro.Tesseract()
+    manifest = scanbro.Manifest(path, [tesseract])
+    manifest.record(tesseract, [input_file], output_file)
+    manifest.close()
+    with open(path, 'a') as file:
+        file.write('{"stage": 0, "inp')
+
+    manifest = scanbro.Manifest(path, [tesseract], resume=True)
+    assert manifest.lookup(tesseract, [input_file]) == (True, output_file)
+    assert manifest.lookup(tesseract, [input_file + 'x']) == (False, None)
+    manifest.close()
+    with open(path) as file:
+        assert len(file.readlines()) == 2
+    os.remove(output_file)
@@ -0,0 +1,53 @@
+import pytest
+
+import scanbro
+
+
+@pytest.fixture
+def unpaper(tools):
+    (tools / 'unpaper').write_text('#!/bin/sh\nexit 1\n')
+    (tools / 'unpaper').chmod(0o755)
+    scanbro.which.cache_clear()
+
+
+def plan(scanner, stages):
+    planner = scanbro.Planner([
+        lambda: scanbro.PNMConvert(),
+        lambda: scanbro.ImageMagick(None, None),
+    ])
+    return [p.binary for p in planner.plan(scanner, stages)]
+
+
+def test_stages_read_scanner_output(tools, unpaper):
+    scanner = scanbro.SimulatedScanner({})
+    assert plan(scanner, [scanbro.Unpaper(), scanbro.Tesseract(), scanbro.Ghostscript()]) == ['unpaper', 'tesseract', 'gs']
+    assert scanner.filetype == 'pnm'
+
+
+def test_scanner_format_suits_first_stage(tools, unpaper):
+    scanner = scanbro.SimulatedScanner({})
+    scanner.filetype = 'png'
+    assert plan(scanner, [scanbro.Unpaper()]) == ['unpaper', 'pnm']
+    assert scanner.filetype == 'pnm'
+
+
+def test_conversion_skipped(tools):
+    scanner = scanbro.SimulatedScanner({})
+    assert plan(scanner, [scanbro.PNMConvert(), scanbro.Tesseract()]) == ['tesseract']
+    assert plan(scanbro.FileSource(['a.tif']), [scanbro.Tesseract()]) == ['tesseract']
+
+
+def test_missing_converter_skipped(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    scanbro.which.cache_clear()
+    try:
+        planner = scanbro.Planner([lambda: scanbro.ImageMagick(None, None), lambda: scanbro.PNMConvert()])
+        assert [p.binary for p in planner.plan(scanbro.FileSource(['a.pgm']), [])] == ['pnm']
+        assert planner.plan(scanbro.FileSource(['a.png']), []) == []
+    finally:
+        scanbro.which.cache_clear()
+
+
+def test_no_converter(tools):
+    with pytest.raises(Exception, match='cannot find a converter for pnm'):
+        plan(scanbro.SimulatedScanner({}), [scanbro.Ghostscript()])
@@ -0,0 +1,73 @@
+import struct
+import zlib
+
+import pytest
+
+import scanbro
+
+
+def read_png(path):
+    """Return the bit depth and the unfiltered rows of the PNG at path."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    i, idat = 8, b''
+    while i < len(data):
+        length, tag = struct.unpack('>I4s', data[i:i+8])
+        chunk = data[i+8:i+8+length]
+        if tag == b'IHDR':
+            width, height, depth, color = struct.unpack('>IIBB', chunk[:10])
+        elif tag == b'IDAT':
+            idat += chunk
+        i += 12 + length
+    pixels = zlib.decompress(idat)
+    stride = len(pixels) // height
+    rows = [pixels[y*stride:(y+1)*stride] for y in range(height)]
+    assert all(row[0] == 0 for row in rows)
+    return depth, [row[1:] for row in rows]
+
+
+def test_read_pnm_header():
+    assert scanbro.read_pnm_header(b'P5 3 2 255\n') == (b'P5', 3, 2, 255, 11)
+    assert scanbro.read_pnm_header(b'P4\n# comment\n16 1\n\xff\xff') == (b'P4', 16, 1, 1, 18)
+    assert scanbro.read_pnm_header(b'P6\n1 1\n65535\n')[3] == 65535
+    with pytest.raises(Exception, match='unsupported PNM format'):
+        scanbro.read_pnm_header(b'P2 1 1 255\n')
+    with pytest.raises(Exception, match='invalid PNM header'):
+        scanbro.read_pnm_header(b'P5 1 x 255\n')
+
+
+def test_truncated(tmp_path):
+    path = tmp_path / 'page.pgm'
+    path.write_bytes(b'P5 4 4 255\n' + bytes(15))
+    with pytest.raises(Exception, match='truncated PNM image'):
+        scanbro.PNMImage(str(path))
+
+
+def test_png_rescales_8bit(tmp_path):
+    path = str(tmp_path / 'page.pgm')
+    with scanbro.PNMImage.create(path, b'P5', 4, 1, 15) as image:
+        image.set_row(0, bytes([0, 1, 8, 15]))
+    scanbro.PNMConvert.convert(path, str(tmp_path / 'original.png'), [])
+    assert read_png(str(tmp_path / 'original.png')) == (8, [bytes([0, 17, 136, 255])])
+    scanbro.PNMConvert.convert(path, str(tmp_path / 'level.png'), ['10%', '90%'])
+    assert read_png(str(tmp_path / 'level.png')) == (8, [bytes([0, 0, 138, 255])])
+
+
+def test_png_rescales_16bit(tmp_path):
+    path = str(tmp_path / 'page.pgm')
+    with scanbro.PNMImage.create(path, b'P5', 3, 1, 4095) as image:
+        for x, v in enumerate([0, 2048, 4095]):
+            image[x, 0] = v
+    scanbro.PNMConvert.convert(path, str(tmp_path / 'page.png'), [])
+    depth, rows = read_png(str(tmp_path / 'page.png'))
+    assert depth == 16
+    assert struct.unpack('>3H', rows[0]) == (0, 32775, 65535)
+
+
+def test_png_inverts_bitmap(tmp_path):
+    path = str(tmp_path / 'page.pbm')
+    with scanbro.PNMImage.create(path, b'P4', 8, 1) as image:
+        image[0, 0] = 1
+    scanbro.PNMConvert.convert(path, str(tmp_path / 'page.png'), [])
+    assert read_png(str(tmp_path / 'page.png')) == (1, [bytes([0x7f])])
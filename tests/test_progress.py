@@ -0,0 +1,70 @@
+import io
+import json
+
+import scanbro
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_include_keeps_order():
+    progress = scanbro.Progress(['files', 'tesseract', 'gs'], stream=io.StringIO())
+    progress.include(['files', 'pnm', 'tesseract', 'gs'])
+    progress.include(['files', 'tesseract', 'gs', 'extra'])
+    assert progress.stages == ['files', 'pnm', 'tesseract', 'gs', 'extra']
+
+
+def test_documents_share_progress():
+    progress = scanbro.Progress(['files'], stream=io.StringIO())
+    progress.expect(2, ['files', 'tesseract', 'gs'])
+    progress.expect(3, ['files', 'pnm', 'tesseract', 'gs'])
+    progress.advance('files', 5)
+    progress.advance('pnm', 3)
+    progress.advance('tesseract', 4)
+    event = progress.snapshot()
+    assert event['total'] == 5
+    assert [(s['stage'], s['done'], s['queue']) for s in event['stages']] == [
+        ('files', 5, 0), ('pnm', 3, 0), ('tesseract', 4, 1), ('gs', 0, 4),
+    ]
+    assert event['bottleneck'] == 'gs'
+    progress.advance('tesseract')
+    progress.advance('gs', 5)
+    assert progress.snapshot()['eta'] == 0.0
+
+
+def test_drop_counts_later_stages():
+    progress = scanbro.Progress(['scanimage', 'blank', 'tesseract'], stream=io.StringIO())
+    progress.expect(2)
+    progress.advance('scanimage', 2)
+    progress.advance('blank', 2)
+    progress.drop('blank')
+    progress.advance('tesseract')
+    event = progress.snapshot()
+    assert [s['queue'] for s in event['stages']] == [0, 0, 0]
+    assert event['eta'] == 0.0
+
+
+def test_events_name_document():
+    stream = io.StringIO()
+    with scanbro.Progress(['scanimage'], stream=stream, interval=60, document='scan.pdf') as progress:
+        progress.expect(1)
+        progress.advance('scanimage')
+    event = json.loads(stream.getvalue())
+    assert event['document'] == 'scan.pdf'
+    assert event['total'] == 1
+
+
+def test_status_line_has_one_owner():
+    first = scanbro.Progress(['scanimage'], stream=Terminal(), interval=60, document='a.pdf')
+    second = scanbro.Progress(['scanimage'], stream=Terminal(), interval=60, document='b.pdf')
+    with first:
+        assert scanbro.Color.status is first
+        with second:
+            assert scanbro.Color.status is first
+            second.report()
+            assert second.stream.getvalue() == ''
+        assert scanbro.Color.status is first
+    assert scanbro.Color.status is None
+    assert first.stream.getvalue().endswith('a.pdf: scanimage 0 0/min | 0:00 left\n')
@@ -0,0 +1,80 @@
+import pytest
+
+import scanbro
+from conftest import parse
+
+
+# Abridged output of scanimage -A for a network scanner.
+OPTIONS = """
+All options specific to device `escl:http://192.168.1.5:80':
+  Scan mode:
+    --mode Lineart|Gray|Color [Color]
+        Selects the scan mode.
+    --resolution 75|150|300|600dpi [300]
+        Sets the resolution of the scanned image.
+    --source Flatbed|ADF|ADF Duplex [Flatbed]
+        Selects the scan source.
+  Geometry:
+    -l 0..215.9mm (in steps of 0.1) [0]
+    -x 0..215.9mm (in steps of 0.1) [215.9]
+    -y 0..297.1mm (in steps of 0.1) [297.1]
+"""
+
+
+def test_parse_scanner_options():
+    options = scanbro.parse_scanner_options(OPTIONS)
+    assert options['--mode'] == {'values': ['Lineart', 'Gray', 'Color'], 'default': 'Color'}
+    assert options['--resolution'] == {'values': ['75', '150', '300', '600dpi'], 'default': '300'}
+    assert options['--source']['values'] == ['Flatbed', 'ADF', 'ADF Duplex']
+    assert options['-x'] == {'values': ['0..215.9mm'], 'default': '215.9'}
+    assert scanbro.parse_range(options['-y']['values']) == (0.0, 297.1)
+    assert scanbro.parse_range(options['--mode']['values']) is None
+
+
+@pytest.fixture
+def scanimage(tools):
+    (tools / 'scanimage').write_text('#!/bin/sh\nexit 1\n')
+    (tools / 'scanimage').chmod(0o755)
+
+
+def test_make_backend(scanimage):
+    backend = scanbro.make_backend('escl:test', 'Test MFP', scanbro.parse_scanner_options(OPTIONS))
+    assert backend.name == 'Test MFP' and backend.device == 'escl:test'
+    assert backend.modes.choices['bw'] == ['--mode', 'Lineart']
+    assert backend.modes.choices['gray'] == ['--mode', 'Gray']
+    assert backend.modes.default == 'color'
+    assert backend.sources.choices['adf'] == ['--source', 'ADF']
+    assert backend.sources.choices['duplex'] == ['--source', 'ADF Duplex']
+    assert backend.duplex_sources == ['adf-duplex', 'duplex']
+    assert list(backend.resolutions.choices) == ['75', '150', '300', '600']
+    assert backend.resolutions.default == '300'
+    # The flatbed is too short for legal paper.
+    assert 'a4' in backend.papersizes.choices and 'legal' not in backend.papersizes.choices
+    assert backend({'source': 'duplex'}).is_duplex()
+
+
+def test_make_backend_from_range():
+    options = scanbro.parse_scanner_options('--resolution 50..600dpi [200]\n--mode Gray|Color [Gray]')
+    backend = scanbro.make_backend('test', 'test', options)
+    assert list(backend.resolutions.choices) == ['75', '100', '150', '200', '300', '400', '600']
+    assert backend.resolutions.default == '200'
+    assert list(backend.sources.choices) == ['auto']
+    assert 'bw' not in backend.modes.choices
+
+
+def test_make_scanner_checks_choices(scanimage, tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    queries = []
+    def query(cmd):
+        queries.append(cmd[1])
+        return {'-L': "device `escl:test' is a Test MFP\n", '-A': OPTIONS}[cmd[1]]
+    monkeypatch.setattr(scanbro.DeviceCache, 'query', staticmethod(query))
+
+    scanner = scanbro.make_scanner(parse(['-b', 'sane', '--source', 'duplex']))
+    assert scanner.device == 'escl:test' and scanner.is_duplex()
+    assert scanner.config['resolution'] == '300' and scanner.config['papersize'] == 'a4'
+    # The devices and their options are cached.
+    scanbro.make_scanner(parse(['-b', 'sane']))
+    assert queries == ['-L', '-A']
+    with pytest.raises(Exception, match='unknown mode sepia for Test MFP'):
+        scanbro.make_scanner(parse(['-b', 'sane', '--mode', 'sepia']))
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+import scanbro
+
+
+def run_commands(commands):
+    async def run(cmd):
+        return await scanbro.Processor.run_cmd_async(cmd)
+    return asyncio.run(scanbro.run_tasks(run, commands, len(commands)))
+
+
+def test_slots_limit_commands(monkeypatch):
+    monkeypatch.setattr(scanbro.Processor, 'slots', threading.BoundedSemaphore(1))
+    start = time.monotonic()
+    run_commands([['sleep', '0.2']] * 3)
+    assert time.monotonic() - start >= 0.6
+
+    monkeypatch.setattr(scanbro.Processor, 'slots', threading.BoundedSemaphore(3))
+    start = time.monotonic()
+    run_commands([['sleep', '0.2']] * 3)
+    assert time.monotonic() - start < 0.5
+
+
+def test_cancelled_waiters_release_slots(monkeypatch):
+    slots = threading.BoundedSemaphore(2)
+    monkeypatch.setattr(scanbro.Processor, 'slots', slots)
+    # The failing command cancels the others, some of which still wait.
+    with pytest.raises(Exception):
+        run_commands([['sleep', '0.3'], ['false']] + [['sleep', '10']] * 4)
+    assert all(slots.acquire(blocking=False) for _ in range(2))
+    assert not slots.acquire(blocking=False)
+
+
+def test_daemon_bounds_pooled_devices(monkeypatch, tmp_path):
+    monkeypatch.setattr(scanbro.Processor, 'slots', None)
+    scanbro.Daemon(str(tmp_path / 'socket'), devices=['a'])
+    assert scanbro.Processor.slots is None
+    scanbro.Daemon(str(tmp_path / 'socket'), devices=['a', 'b'])
+    cores = os.cpu_count() or 1
+    assert all(scanbro.Processor.slots.acquire(blocking=False) for _ in range(cores))
+    assert not scanbro.Processor.slots.acquire(blocking=False)
@@ -0,0 +1,15 @@
+import pytest
+
+import scanbro
+from conftest import pages, parse
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_pages_stay_in_order(tools, tmp_path, stream):
+    output = str(tmp_path / 'scan.pdf')
+    argv = ['-b', 'simulated', '-d', 'pages=4,latency=0.01', '-f', 'tesseract', '-f', 'ghostscript', '-j', '4']
+    if stream:
+        argv.append('--stream')
+    files = scanbro.run(parse(argv), output)
+    assert len(files) == 1
+    assert [name.split('.')[1] for name in pages(files[0])] == ['1', '2', '3', '4']
@@ -0,0 +1,44 @@
+import concurrent.futures
+import os
+
+import scanbro
+from conftest import parse
+
+
+def test_place_reserves_estimate(tmp_path):
+    workdir = scanbro.Workdir(str(tmp_path), 100)
+    destination = str(tmp_path / 'out')
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        placed = list(executor.map(lambda i: workdir.place(f'page.{i}.png', destination, 30), range(8)))
+    inside = [f for f in placed if not f.startswith(destination)]
+    assert len(inside) == 3
+    assert all(os.path.dirname(f) == workdir.path for f in inside)
+
+    # Once complete, files count by their actual size.
+    for file in inside:
+        with open(file, 'wb') as f:
+            f.write(bytes(10))
+    workdir.release()
+    assert workdir.place('page.9.png', destination, 60).startswith(workdir.path)
+
+
+def test_created_lazily(tmp_path):
+    workdir = scanbro.Workdir(str(tmp_path), 100)
+    assert workdir.place('page.1.png', str(tmp_path), 200) == str(tmp_path / 'page.1.png')
+    assert workdir.path is None
+    workdir.cleanup()
+    assert os.listdir(tmp_path) == []
+
+
+def test_intermediates_kept_next_to_output(tools, tmp_path):
+    (tmp_path / 'shm').mkdir()
+    output = str(tmp_path / 'scan.pdf')
+    argv = ['-b', 'simulated', '-d', 'pages=2', '-f', 'tesseract', '-f', 'ghostscript', '--workdir', str(tmp_path / 'shm')]
+    scanbro.run(parse(argv), output)
+    assert os.listdir(tmp_path / 'shm') == []
+    assert (tmp_path / 'scan.1.tesseract.pdf').exists()
+    assert (tmp_path / 'scan.2.tesseract.pdf').exists()
+
+    scanbro.run(parse(argv + ['-c']), str(tmp_path / 'clean.pdf'))
+    assert os.listdir(tmp_path / 'shm') == []
+    assert not (tmp_path / 'clean.1.tesseract.pdf').exists()